@@ -0,0 +1,216 @@
+"""
+Асинхронные аналоги функций app.pyrus_api для asyncio-движка сканера.
+
+Разбор ответов и проверки общие с синхронной версией (TaskSnapshot,
+member_from_response, build_comment_body), здесь — только транспорт на aiohttp
+и повторы через asyncio.sleep вместо time.sleep.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from typing import Dict, List, Optional, Type
+
+import aiohttp
+
+from app import metrics, rate_limit
+from app.http_client import DEFAULT_HEADERS
+from app.lock_utils import unlock_task
+from app.pyrus_api import (APIError, TaskSnapshot, build_comment_body, build_comments_api_url,
+                           build_member_api_url, build_task_api_url, member_cache, member_from_response,
+                           token_manager)
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+NETWORK_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# запросы GET /members/{id} в работе: одновременные промахи кэша по одному сотруднику ждут один запрос
+_member_requests: Dict[int, asyncio.Future] = {}
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Сессия aiohttp с пулом соединений под ASYNC_CONCURRENCY одновременных задач."""
+    connector = aiohttp.TCPConnector(limit=settings.ASYNC_CONCURRENCY,
+                                     limit_per_host=settings.ASYNC_CONCURRENCY)
+    return aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS,
+                                 timeout=aiohttp.ClientTimeout(total=30))
+
+
+def async_retry_on_exception(tries: int = 2,
+                             delay: float = 30.0,
+                             exceptions: tuple[Type[BaseException], ...] = (Exception,),
+                             unlock_on_fail: bool = False):
+    """
+    Асинхронный вариант pyrus_api.retry_on_exception: ждёт через asyncio.sleep.
+    RETRY_MODE="reschedule" действует так же: одна попытка, повтор планирует process_task_async.
+    """
+    if tries < 1:
+        raise ValueError(f"Было получено {tries} попыток, когда их должно быть >= 1.")
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            deferred = unlock_on_fail and settings.RETRY_MODE == "reschedule"
+            attempts = 1 if deferred else tries
+            last_exc = None
+            for attempt in range(1, attempts + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions as e:
+                    last_exc = e
+                    logger.warning("Attempt %s/%s failed for %s: %r", attempt, attempts, func.__name__, e)
+                    if attempt < attempts:
+                        metrics.PYRUS_RETRIES.inc(function=func.__name__)
+                        await asyncio.sleep(delay)
+
+            if unlock_on_fail and not deferred:
+                task_id = signature.bind_partial(*args, **kwargs).arguments.get("task_id")
+                if task_id is not None:
+                    try:
+                        await asyncio.to_thread(unlock_task, task_id)
+                        logger.info("Task %s has been unlocked after all retries failed.", task_id)
+                    except Exception as ue:
+                        logger.error("Failed to unlock task %s after retries: %s", task_id, ue)
+            if last_exc:
+                metrics.PYRUS_FAILURES.inc(function=func.__name__)
+                raise last_exc
+        return wrapper
+    return decorator
+
+
+async def _request_json(session: aiohttp.ClientSession, method: str, url: str, token: str,
+                        context: str, **kwargs) -> tuple[int, dict]:
+    """
+    Запрос к API с токеном через общий ограничитель частоты (rate_limit).
+    При 401 токен обновляется и запрос повторяется один раз, при 429 — после
+    паузы по Retry-After, до RATE_LIMIT_MAX_RETRIES раз.
+    Возвращает (HTTP-статус, JSON) и бросает aiohttp.ClientResponseError на прочие ошибки.
+    """
+    endpoint = rate_limit.endpoint_class(method)
+    bucket = rate_limit.get_bucket(endpoint)
+    token = token_manager.current(token)
+    refreshed = False
+    throttled = 0
+    while True:
+        wait = bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        headers = {"Authorization": f"Bearer {token}"}
+        started = time.perf_counter()
+        try:
+            response_cm = await session.request(method, url, headers=headers, **kwargs)
+        except NETWORK_ERRORS:
+            metrics.observe_pyrus_request(method, url, "error", time.perf_counter() - started)
+            raise
+        metrics.observe_pyrus_request(method, url, response_cm.status, time.perf_counter() - started)
+        async with response_cm as resp:
+            if resp.status == 401 and not refreshed:
+                refreshed = True
+                fresh = await asyncio.to_thread(token_manager.refresh, token)
+                if fresh and fresh != token:
+                    logger.info("Got 401 for %s %s, retrying with a refreshed token.", method, url)
+                    token = fresh
+                    continue
+            if resp.status == 429:
+                rate_limit.throttled(endpoint, resp.headers.get("Retry-After"))
+                if throttled < settings.RATE_LIMIT_MAX_RETRIES:
+                    throttled += 1
+                    logger.info("Retrying %s %s after 429 (%s/%s).", method, url,
+                                throttled, settings.RATE_LIMIT_MAX_RETRIES)
+                    continue
+            resp.raise_for_status()
+            try:
+                return resp.status, await resp.json(content_type=None)
+            except ValueError as e:
+                snippet = (await resp.text())[:300].replace("\n", " ")
+                raise RuntimeError(f"Couldn't parse the JSON in the response {context}: {resp.status} {snippet}") from e
+
+
+async def get_task_snapshot(session: aiohttp.ClientSession, task_id: int, token: str) -> TaskSnapshot:
+    try:
+        _, data = await _request_json(session, "GET", build_task_api_url(task_id), token, context="task")
+    except aiohttp.ClientResponseError as e:
+        if e.status == 403:
+            return TaskSnapshot(task_id, None, False)
+        return TaskSnapshot(task_id, None, None)
+    except NETWORK_ERRORS as e:
+        logger.warning("Network error while getting task %s: %s", task_id, e)
+        return TaskSnapshot(task_id, None, None)
+    return TaskSnapshot.from_response(task_id, data)
+
+
+async def _fetch_member(session: aiohttp.ClientSession, member_id: int, token: str) -> dict:
+    try:
+        _, data = await _request_json(session, "GET", build_member_api_url(member_id), token, context="member")
+    except NETWORK_ERRORS as e:
+        raise APIError(f"Couldn't get an employee #{member_id}: {e}") from e
+    info = member_from_response(member_id, data)
+    member_cache.set(member_id, info)
+    return info
+
+
+def _forget_member_request(member_id: int, request: asyncio.Future):
+    if _member_requests.get(member_id) is request:
+        del _member_requests[member_id]
+
+
+@async_retry_on_exception(tries=3, delay=30.0, exceptions=(APIError, *NETWORK_ERRORS), unlock_on_fail=True)
+async def get_member(session: aiohttp.ClientSession, member_id: int, token: str) -> dict:
+    info = member_cache.get(member_id)
+    if info is not None:
+        return info
+    request = _member_requests.get(member_id)
+    if request is None or request.done() or request.get_loop() is not asyncio.get_running_loop():
+        request = asyncio.ensure_future(_fetch_member(session, member_id, token))
+        _member_requests[member_id] = request
+        request.add_done_callback(functools.partial(_forget_member_request, member_id))
+    else:
+        member_cache.coalesced += 1
+    # shield: отмена одной ожидающей задачи не отменяет общий запрос
+    return await asyncio.shield(request)
+
+
+async def _post_comment(session: aiohttp.ClientSession, task_id: int, token: str, body: dict) -> bool:
+    try:
+        _, data = await _request_json(session, "POST", build_comments_api_url(task_id), token,
+                                      context="comments", json=body)
+    except NETWORK_ERRORS as e:
+        raise APIError(f"Couldn't post a comment for the issue #{task_id}: {e}") from e
+
+    if "task" in data and data["task"]:
+        return True
+    raise APIError(f"Couldn't post comment: invalid API response #{task_id}: {data}")
+
+
+@async_retry_on_exception(tries=3, delay=30.0,
+                          exceptions=(RuntimeError, *NETWORK_ERRORS), unlock_on_fail=True)
+async def add_managers_to_subscribers(session: aiohttp.ClientSession, task_id: int, token: str,
+                                      ids_approvals: List[dict[str, int]]) -> bool:
+    result = await _post_comment(session, task_id, token, {"subscribers_added": ids_approvals})
+    logger.info("managers successfully added to subscribers in task #%s.", task_id)
+    return result
+
+
+async def remove_bot_from_subscribers(session: aiohttp.ClientSession, task_id: int, token: str) -> bool:
+    result = await comment_task(session, task_id, token, remove_bot=True)
+    logger.info("bot successfully removed from subscribers.")
+    return result
+
+
+@async_retry_on_exception(tries=3, delay=30.0,
+                          exceptions=(APIError, *NETWORK_ERRORS), unlock_on_fail=True)
+async def comment_task(session: aiohttp.ClientSession, task_id: int, token: str, text: Optional[str] = None,
+                       members_info: Optional[dict] = None, remove_bot: bool = False) -> bool:
+    """Составной комментарий одним запросом, см. pyrus_api.comment_task."""
+    body = build_comment_body(task_id, text, members_info, remove_bot)
+    return await _post_comment(session, task_id, token, body)
+
+
+async def send_comment(session: aiohttp.ClientSession, token: str, task_id: int, text: str,
+                       members_info: dict) -> bool:
+    """Отправить комментарий в задачу с упоминанием сотрудника (менеджеры подписываются тем же запросом)."""
+    return await comment_task(session, task_id, token, text, members_info)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с временем жизни записей.
+
+    Не больше maxsize записей (вытесняется давно не использованная), запись
+    старше ttl секунд считается отсутствующей. hits/misses — счётчики обращений,
+    coalesced — промахи, дождавшиеся чужой загрузки того же ключа (load).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable) -> Optional[Any]:
+        # вызывается под self._lock
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if time.monotonic() < expires_at:
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+        return None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Загрузить значение после промаха и положить в кэш. Одновременные промахи
+        по одному ключу выполняют loader один раз: остальные потоки ждут его
+        результат (или получают его исключение).
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._loading[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._store(key, value)
+            del self._loading[key]
+        future.set_result(value)
+        return value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        return value if value is not None else self.load(key, loader)
+
+    def _store(self, key: Hashable, value: Any):
+        # вызывается под self._lock
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._store(key, value)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -1,10 +1,20 @@
+import asyncio
 import logging
 from app.db_utils import delete_task
-from app.pyrus_api import remove_bot_from_subscribers
+from app.pyrus_api import comment_task
 
 logger = logging.getLogger(__name__)
 
 def cleanup_task(task_id: int, token: str, reason: str):
+    # сначала отписка: если она не удалась, строка остаётся и повтор (schedule_retry/unlock) её найдёт
+    comment_task(task_id, token, remove_bot=True)
     delete_task(task_id)
-    remove_bot_from_subscribers(task_id, token)
-    logger.info("Task %s removed from DB and unsubscribed (reason: %s).", task_id, reason)
\ No newline at end of file
+    logger.info("Task %s removed from DB and unsubscribed (reason: %s).", task_id, reason)
+
+
+async def cleanup_task_async(session, task_id: int, token: str, reason: str):
+    from app import async_pyrus_api
+
+    await async_pyrus_api.comment_task(session, task_id, token, remove_bot=True)
+    await asyncio.to_thread(delete_task, task_id)
+    logger.info("Task %s removed from DB and unsubscribed (reason: %s).", task_id, reason)
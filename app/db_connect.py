@@ -1,11 +1,41 @@
 import sqlite3
+import threading
 
 from conf.config import settings
 
+_local = threading.local()
 
-def db_connect():
-    conn = sqlite3.connect(settings.DATABASE_PATH, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(settings.DATABASE_PATH, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                           cached_statements=settings.DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA busy_timeout = 30000;")
-    return conn
\ No newline at end of file
+    # в WAL synchronous=NORMAL не теряет целостность, fsync только на checkpoint
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA cache_size = -{int(settings.DB_CACHE_SIZE_KB)};")
+    conn.execute(f"PRAGMA mmap_size = {int(settings.DB_MMAP_SIZE)};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+
+def db_connect() -> sqlite3.Connection:
+    """
+    Соединение с БД текущего потока.
+    Открывается один раз на поток, PRAGMA выполняются при открытии, подготовленные
+    запросы кэшируются соединением. Закрывать его не нужно; для записи используйте
+    `with db_connect() as conn:` — commit при успехе, rollback при исключении.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _open_connection()
+    return conn
+
+
+def close_db():
+    """Закрыть соединение текущего потока (например, при остановке)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
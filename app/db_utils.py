@@ -1,16 +1,153 @@
 import logging
+import random
+import sqlite3
 from datetime import datetime, timezone, timedelta, time
-from typing import List
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
 from zoneinfo import ZoneInfo
 from app.db_connect import db_connect
-from app.utils import now_utc, to_iso
+from app.due_timer import due_timer
+from app.lease import INSTANCE_ID, leases
+from app.task_store import Fence, SlotLoad, SlotPicker, TaskStore, TaskTuple, get_task_store
+from app.timestamps import to_epoch
+from app.utils import now_epoch
 from conf.config import settings
 
 logger = logging.getLogger(__name__)
 
+def _columns(conn, table: str) -> set:
+    return {r["name"] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _migration_retry_columns(conn):
+    """v1: счётчик попыток и текущий backoff для RETRY_MODE=reschedule."""
+    columns = _columns(conn, "active_tasks")
+    if "retry_attempts" not in columns:
+        conn.execute("ALTER TABLE active_tasks ADD COLUMN retry_attempts INTEGER DEFAULT 0")
+    if "retry_backoff" not in columns:
+        conn.execute("ALTER TABLE active_tasks ADD COLUMN retry_backoff INTEGER DEFAULT 0")
+
+
+def _migration_epoch_columns(conn):
+    """
+    v2: due, next_run_at, locked_at — INTEGER (секунды UTC epoch) вместо ISO TEXT.
+    Таблица пересоздаётся; старые значения разбираются один раз здесь, а не при каждом скане.
+    Индекс (processing, next_run_at) делает выборку готовых задач range scan'ом.
+    """
+    conn.execute("""
+    CREATE TABLE active_tasks_new (
+        task_id INTEGER PRIMARY KEY,
+        due INTEGER NOT NULL,
+        next_run_at INTEGER NOT NULL,
+        processing INTEGER DEFAULT 0,
+        locked_at INTEGER,
+        step INTEGER DEFAULT 1,
+        retry_attempts INTEGER DEFAULT 0,
+        retry_backoff INTEGER DEFAULT 0
+    )""")
+
+    def epoch_or_none(value):
+        if value is None:
+            return None
+        if isinstance(value, (int, float)):
+            return int(value)
+        try:
+            return to_epoch(value)
+        except ValueError:
+            return None
+
+    now = now_epoch()
+    rows = conn.execute(
+        "SELECT task_id, due, next_run_at, processing, locked_at, step, retry_attempts, retry_backoff FROM active_tasks"
+    ).fetchall()
+    converted = []
+    for r in rows:
+        next_run = epoch_or_none(r["next_run_at"])
+        if next_run is None:
+            logger.warning("Task %s has unparsable next_run_at %r, scheduling it now.", r["task_id"], r["next_run_at"])
+            next_run = now
+        due = epoch_or_none(r["due"])
+        converted.append((
+            r["task_id"], due if due is not None else next_run, next_run, r["processing"],
+            epoch_or_none(r["locked_at"]), r["step"], r["retry_attempts"], r["retry_backoff"],
+        ))
+    conn.executemany("INSERT INTO active_tasks_new VALUES (?, ?, ?, ?, ?, ?, ?, ?)", converted)
+
+    conn.execute("DROP TABLE active_tasks")
+    conn.execute("ALTER TABLE active_tasks_new RENAME TO active_tasks")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processing_next_run ON active_tasks(processing, next_run_at)")
+
+
+def _migration_jobs_table(conn):
+    """v3: очередь фоновых заданий (app.job_queue), например обновление клиента в задаче-обращении."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        dedup_key TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_run_at INTEGER NOT NULL,
+        locked_at INTEGER,
+        last_error TEXT,
+        created_at INTEGER NOT NULL,
+        UNIQUE (kind, dedup_key)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_next_run ON jobs(status, next_run_at)")
+
+
+def _migration_lease_columns(conn):
+    """v4: аренда задач — владелец, срок и fencing token (app.lease)."""
+    columns = _columns(conn, "active_tasks")
+    if "lease_owner" not in columns:
+        conn.execute("ALTER TABLE active_tasks ADD COLUMN lease_owner TEXT")
+    if "lease_expires_at" not in columns:
+        conn.execute("ALTER TABLE active_tasks ADD COLUMN lease_expires_at INTEGER")
+    if "lease_token" not in columns:
+        conn.execute("ALTER TABLE active_tasks ADD COLUMN lease_token INTEGER NOT NULL DEFAULT 0")
+
+
+def _migration_webhook_events(conn):
+    """v5: обработанные события вебхука для WEBHOOK_DEDUP_PERSIST (app.webhook_dedup)."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS webhook_events (
+        task_id INTEGER NOT NULL,
+        last_modified TEXT NOT NULL,
+        handled_at INTEGER NOT NULL,
+        PRIMARY KEY (task_id, last_modified)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_events_handled_at ON webhook_events(handled_at)")
+
+
+def _migration_job_owner(conn):
+    """v6: какой процесс выполняет задание (recover_stale_jobs при рестарте того же INSTANCE_ID)."""
+    if "locked_by" not in _columns(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN locked_by TEXT")
+
+
+# Миграции схемы по порядку; номер версии хранится в PRAGMA user_version
+MIGRATIONS = [
+    _migration_retry_columns,
+    _migration_epoch_columns,
+    _migration_jobs_table,
+    _migration_lease_columns,
+    _migration_webhook_events,
+    _migration_job_owner,
+]
+
+
+def _migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info("Applying DB migration v%s: %s", number, migration.__name__)
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+
+
 def init_db():
-    conn = db_connect()
-    try:
+    with db_connect() as conn:
+        # схема и миграции — одной транзакцией, чтобы параллельный запуск не мигрировал дважды
+        conn.execute("BEGIN IMMEDIATE")
         conn.execute("""
         CREATE TABLE IF NOT EXISTS active_tasks (
             task_id INTEGER PRIMARY KEY,
@@ -20,207 +157,422 @@ def init_db():
             locked_at TEXT,
             step INTEGER DEFAULT 1
         )""")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_next_run ON active_tasks(next_run_at)")
-        conn.commit()
-    finally:
-        conn.close()
+        _migrate(conn)
+    # схема SQLite нужна при любом TASK_STORE: очередь jobs остаётся в БД
+    get_task_store().init()
 
 
-def insert_task(task_id: str, due_iso: str, next_run: str):
-    conn = db_connect()
-    try:
-        conn.execute(
-            "INSERT INTO active_tasks (task_id, due, next_run_at, processing, step) VALUES (?, ?, ?, 0, 1)",
-            (task_id, due_iso, next_run)
+def _fence_sql(fence: Fence) -> Tuple[str, tuple]:
+    """Условие WHERE для записи с проверкой аренды (пустое без fence)."""
+    if fence is None:
+        return "", ()
+    return " AND lease_owner = ? AND lease_token = ?", fence
+
+
+class SqliteTaskStore(TaskStore):
+    """Хранилище в таблице active_tasks (схему создаёт init_db)."""
+
+    def insert(self, task_id: int, due: int, next_run_at: int):
+        with db_connect() as conn:
+            conn.execute(
+                "INSERT INTO active_tasks (task_id, due, next_run_at, processing, step) VALUES (?, ?, ?, 0, 1)",
+                (task_id, due, next_run_at)
+            )
+
+    def register_many(self, rows: Iterable[TaskTuple], on_conflict: str) -> List[Optional[int]]:
+        sql = _REGISTER_SQL[on_conflict]
+        with db_connect() as conn:
+            result = []
+            for row in rows:
+                stored = conn.execute(sql, row).fetchone()
+                result.append(stored[0] if stored is not None else None)
+            return result
+
+    def has(self, task_id: int) -> bool:
+        cur = db_connect().execute("SELECT 1 FROM active_tasks WHERE task_id = ? LIMIT 1", (task_id,))
+        return bool(cur.fetchone())
+
+    def get(self, task_id: int) -> Optional[sqlite3.Row]:
+        return db_connect().execute("SELECT * FROM active_tasks WHERE task_id = ?", (task_id,)).fetchone()
+
+    def due_ids(self, now: int, limit: int) -> List[int]:
+        cur = db_connect().execute(
+            "SELECT task_id FROM active_tasks WHERE processing = 0 AND next_run_at <= ? ORDER BY next_run_at LIMIT ?",
+            (now, limit)
         )
-        conn.commit()
-    finally:
-        conn.close()
+        return [r["task_id"] for r in cur.fetchall()]
 
-def has_task(task_id: int) -> bool:
-    """Проверяет, есть ли task_id в active_tasks."""
-    conn = db_connect()
-    try:
+    def count_due(self, now: int) -> int:
+        cur = db_connect().execute(
+            "SELECT COUNT(*) FROM active_tasks WHERE processing = 0 AND next_run_at <= ?", (now,)
+        )
+        return cur.fetchone()[0]
+
+    def claim(self, now: int, limit: int, owner: str, lease_expires_at: int) -> List[sqlite3.Row]:
+        # выбор и захват одним UPDATE ... RETURNING
+        with db_connect() as conn:
+            cur = conn.execute(
+                "UPDATE active_tasks SET processing = 1, locked_at = ?, lease_owner = ?, lease_expires_at = ?, "
+                "lease_token = lease_token + 1 WHERE task_id IN ("
+                "SELECT task_id FROM active_tasks WHERE processing = 0 AND next_run_at <= ? "
+                "ORDER BY next_run_at LIMIT ?) RETURNING *",
+                (now, owner, lease_expires_at, now, limit)
+            )
+            rows = cur.fetchall()
+        return sorted(rows, key=lambda r: r["next_run_at"])
+
+    def try_lock(self, task_id: int, now: int, owner: str, lease_expires_at: int) -> Optional[int]:
+        with db_connect() as conn:
+            row = conn.execute(
+                "UPDATE active_tasks SET processing = 1, locked_at = ?, lease_owner = ?, lease_expires_at = ?, "
+                "lease_token = lease_token + 1 WHERE task_id = ? AND processing = 0 RETURNING lease_token",
+                (now, owner, lease_expires_at, task_id)
+            ).fetchone()
+        return row["lease_token"] if row is not None else None
+
+    @staticmethod
+    def _slot_load(conn, window_start: int, slot_seconds: int, slots: int, exclude_task_id: int) -> Dict[int, int]:
         cur = conn.execute(
-            "SELECT 1 FROM active_tasks WHERE task_id = ? LIMIT 1",
-            (task_id,)
+            "SELECT (next_run_at - ?) / ? AS slot, COUNT(*) AS n FROM active_tasks "
+            "WHERE processing IN (0, 1) AND next_run_at >= ? AND next_run_at < ? AND task_id != ? GROUP BY slot",
+            (window_start, slot_seconds, window_start, window_start + slots * slot_seconds, exclude_task_id)
         )
-        return bool(cur.fetchone())
-    finally:
-        conn.close()
-
-def parse_iso_to_utc(s: str) -> datetime:
-    """Парсит ISO-строку в tz-aware UTC datetime.
-    Возвращает datetime в UTC или бросает ValueError/TypeError при некорректном формате.
-    Поддерживает строки с 'Z', с '+00:00' и без указания зоны (в этом случае предполагается UTC).
-    """
-    if s is None:
-        raise ValueError("empty datetime string")
-
-    if isinstance(s, datetime):
-        dt = s
-    else:
-        # fromisoformat не понимает 'Z' — заменяем
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        # Если нет смещения (наивная строка типа "2025-08-28T09:30:01"), считаем её UTC
-        # Простая эвристика: если в строке нет '+' и нет '-' в части времени (последние 6 символов),
-        # то добавим +00:00
-        if ("+" not in s and "-" not in s[-6:]):
-            s = s + "+00:00"
-
-        dt = datetime.fromisoformat(s)  # может бросить ValueError
-
-    # Сделаем aware и приведём к UTC
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc) # type: ignore
-    return dt.astimezone(timezone.utc)
-
-def _parse_iso_to_utc(s: str) -> datetime:
-    """Парсит ISO-строку в tz-aware UTC datetime.
-    Возвращает datetime в UTC или бросает ValueError/TypeError при некорректном формате.
-    Поддерживает строки с 'Z', с '+00:00' и без указания зоны (в этом случае предполагается UTC).
-    """
-    if s is None:
-        raise ValueError("empty datetime string")
-
-    if isinstance(s, datetime):
-        dt = s
-    else:
-        # fromisoformat не понимает 'Z' — заменяем
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        # Если нет смещения (наивная строка типа "2025-08-28T09:30:01"), считаем её UTC
-        # Простая эвристика: если в строке нет '+' и нет '-' в части времени (последние 6 символов),
-        # то добавим +00:00
-        if ("+" not in s and "-" not in s[-6:]):
-            s = s + "+00:00"
-
-        dt = datetime.fromisoformat(s)  # может бросить ValueError
-
-    # Сделаем aware и приведём к UTC
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc) # type: ignore
-    return dt.astimezone(timezone.utc)
+        return {r["slot"]: r["n"] for r in cur.fetchall()}
+
+    def reschedule(self, task_id: int, step: int, pick_slot: SlotPicker, fence: Fence) -> Optional[int]:
+        where, params = _fence_sql(fence)
+        with db_connect() as conn:
+            # подсчёт занятости слотов и запись — одной транзакцией записи
+            conn.execute("BEGIN IMMEDIATE")
+            next_run = pick_slot(lambda *args: self._slot_load(conn, *args))
+            cur = conn.execute(
+                "UPDATE active_tasks SET step=?, next_run_at = ?, processing = 0, locked_at = NULL, "
+                "lease_owner = NULL, lease_expires_at = NULL, "
+                f"retry_attempts = 0, retry_backoff = 0 WHERE task_id = ?{where}",
+                (step, next_run, task_id, *params)
+            )
+        return next_run if cur.rowcount == 1 else None
+
+    def retry(self, task_id: int, now: int, backoff: Callable[[int], int],
+              fence: Fence) -> Optional[Tuple[int, int, int]]:
+        where, params = _fence_sql(fence)
+        with db_connect() as conn:
+            # чтение счётчика и запись — одной транзакцией записи, как в reschedule
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT retry_attempts FROM active_tasks WHERE task_id = ?{where}", (task_id, *params)
+            ).fetchone()
+            if row is None:
+                return None
+            attempt = (row["retry_attempts"] or 0) + 1
+            delay = backoff(attempt)
+            next_run_at = now + delay
+            cur = conn.execute(
+                "UPDATE active_tasks SET retry_attempts = ?, retry_backoff = ?, next_run_at = ?, "
+                "processing = 0, locked_at = NULL, lease_owner = NULL, lease_expires_at = NULL "
+                f"WHERE task_id = ?{where}",
+                (attempt, delay, next_run_at, task_id, *params)
+            )
+        return (attempt, delay, next_run_at) if cur.rowcount == 1 else None
+
+    def set_step(self, task_id: int, step: int, fence: Fence) -> bool:
+        where, params = _fence_sql(fence)
+        with db_connect() as conn:
+            cur = conn.execute(f"UPDATE active_tasks SET step = ? WHERE task_id = ?{where}", (step, task_id, *params))
+        return cur.rowcount == 1
+
+    def delete(self, task_id: int, fence: Fence) -> bool:
+        where, params = _fence_sql(fence)
+        with db_connect() as conn:
+            cur = conn.execute(f"DELETE FROM active_tasks WHERE task_id = ?{where}", (task_id, *params))
+        return cur.rowcount == 1
+
+    def unlock(self, task_id: int, fence: Fence) -> bool:
+        where, params = _fence_sql(fence)
+        with db_connect() as conn:
+            cur = conn.execute(
+                "UPDATE active_tasks SET processing = 0, locked_at = NULL, lease_owner = NULL, lease_expires_at = NULL "
+                f"WHERE task_id = ?{where}",
+                (task_id, *params)
+            )
+        return cur.rowcount == 1
+
+    def renew_leases(self, owner: str, held: Mapping[int, int], lease_expires_at: int) -> List[int]:
+        lost = []
+        with db_connect() as conn:
+            for task_id, token in held.items():
+                cur = conn.execute(
+                    "UPDATE active_tasks SET lease_expires_at = ? "
+                    "WHERE task_id = ? AND processing = 1 AND lease_owner = ? AND lease_token = ?",
+                    (lease_expires_at, task_id, owner, token)
+                )
+                if cur.rowcount != 1:
+                    lost.append(task_id)
+        return lost
+
+    def recover_stale(self, now: int, legacy_expiry: int) -> List[int]:
+        with db_connect() as conn:
+            cur = conn.execute(
+                "UPDATE active_tasks SET processing = 0, locked_at = NULL, lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE processing = 1 AND (lease_expires_at <= ? OR (lease_expires_at IS NULL AND locked_at <= ?)) "
+                "RETURNING task_id",
+                (now, legacy_expiry)
+            )
+            return [r["task_id"] for r in cur.fetchall()]
+
+    def pending_deadlines(self, until: int) -> Dict[int, int]:
+        # диапазон по idx_processing_next_run: читается только ближайшая часть таблицы
+        cur = db_connect().execute(
+            "SELECT task_id, next_run_at FROM active_tasks WHERE processing = 0 AND next_run_at <= ?", (until,)
+        )
+        return {r["task_id"]: r["next_run_at"] for r in cur.fetchall()}
+
+    def stats(self, now: int) -> dict:
+        conn = db_connect()
+        row = conn.execute(
+            "SELECT SUM(processing = 0 AND next_run_at <= ?) AS due, SUM(processing = 1) AS locked, "
+            "MIN(CASE WHEN processing = 1 THEN locked_at END) AS oldest_lock FROM active_tasks",
+            (now,)
+        ).fetchone()
+        steps = conn.execute("SELECT step, COUNT(*) AS n FROM active_tasks GROUP BY step").fetchall()
+        return {
+            "due": row["due"] or 0,
+            "locked": row["locked"] or 0,
+            "oldest_lock_age": now - row["oldest_lock"] if row["oldest_lock"] is not None else 0,
+            "by_step": {r["step"]: r["n"] for r in steps},
+        }
+
+
+def insert_task(task_id: str, due_iso: str, next_run: str):
+    """due_iso и next_run — ISO-строки; в хранилище — секунды UTC epoch."""
+    next_run_at = to_epoch(next_run)
+    get_task_store().insert(int(task_id), to_epoch(due_iso), next_run_at)
+    due_timer.schedule(int(task_id), next_run_at)
+
+
+_REGISTER_SQL = {
+    # задача уже есть — ничего не меняем
+    "ignore": (
+        "INSERT INTO active_tasks (task_id, due, next_run_at, processing, step) VALUES (?, ?, ?, 0, 1) "
+        "ON CONFLICT(task_id) DO NOTHING RETURNING next_run_at"
+    ),
+    # задача уже есть — обновляем due, если он изменился; next_run_at — только пока первое
+    # напоминание ещё не отправлено и задача не в обработке
+    "update_due": (
+        "INSERT INTO active_tasks (task_id, due, next_run_at, processing, step) VALUES (?, ?, ?, 0, 1) "
+        "ON CONFLICT(task_id) DO UPDATE SET due = excluded.due, "
+        "next_run_at = CASE WHEN active_tasks.step = 1 AND active_tasks.processing = 0 "
+        "THEN excluded.next_run_at ELSE active_tasks.next_run_at END "
+        "WHERE active_tasks.due != excluded.due RETURNING next_run_at"
+    ),
+}
+
+
+def register_task(task_id: int, due_iso: str, next_run_iso: str, on_conflict: Optional[str] = None) -> bool:
+    """
+    Атомарно зарегистрировать задачу одним запросом (без has_task + insert_task).
+    on_conflict: "ignore" или "update_due" (по умолчанию REGISTER_CONFLICT_POLICY).
+    Возвращает True, если строка вставлена или обновлена, False — если ничего не изменилось.
+    """
+    return register_tasks([(task_id, to_epoch(due_iso), to_epoch(next_run_iso))], on_conflict)[0]
+
+
+def register_tasks(rows: Iterable[Tuple[int, int, int]], on_conflict: Optional[str] = None) -> List[bool]:
+    """
+    Зарегистрировать пачку задач (task_id, due_epoch, next_run_epoch) одной транзакцией.
+    Для каждой строки возвращает то же, что register_task.
+    """
+    rows = list(rows)
+    stored = get_task_store().register_many(rows, on_conflict or settings.REGISTER_CONFLICT_POLICY)
+    for (task_id, _, next_run_at), stored_run_at in zip(rows, stored):
+        # update_due не трогает next_run_at после первого напоминания и во время обработки:
+        # таймер ставим, только если записан именно новый срок
+        if stored_run_at is not None and stored_run_at == next_run_at:
+            due_timer.schedule(task_id, next_run_at)
+    return [stored_run_at is not None for stored_run_at in stored]
+
+def has_task(task_id: int) -> bool:
+    """Проверяет, есть ли task_id в active_tasks."""
+    return get_task_store().has(task_id)
 
 
 def fetch_candidates(limit: int = 100) -> List[int]:
+    """Возвращает task_id до limit задач, готовых к выполнению (next_run_at <= now)."""
+    return get_task_store().due_ids(now_epoch(), limit)
+
+
+def count_due_tasks() -> int:
+    """Число готовых к выполнению, но ещё не захваченных задач (глубина очереди)."""
+    return get_task_store().count_due(now_epoch())
+
+
+def queue_stats() -> dict:
+    """Срез очереди для метрик: готовые, захваченные, возраст старейшей блокировки, задачи по шагам."""
+    return get_task_store().stats(now_epoch())
+
+
+def claim_due_tasks(limit: int = 100) -> List[Mapping]:
     """
-    Возвращает task_id задач ready к выполнению (dt <= now).
-    Подход: берем небольшой запас строк из БД, парсим даты и фильтруем в Python.
-    Это безопаснее при разнородных форматах, но медленнее, чем сравнение в SQL.
+    Атомарно выбрать и арендовать до limit готовых задач.
+    Возвращает полные строки захваченных задач (processing=1), чтобы process_task
+    не перечитывал их через get_task_row. Заменяет fetch_candidates + try_lock_task.
+    Аренда оформляется на INSTANCE_ID на LEASE_SECONDS с новым lease_token.
     """
-    conn = db_connect()
-    try:
-        # берём с запасом — чтобы не сделать N запросов; tweak size при необходимости
-        cur = conn.execute(
-            "SELECT task_id, next_run_at FROM active_tasks WHERE processing = 0 ORDER BY next_run_at LIMIT ?",
-            (limit * 5,)
-        )
-        rows = cur.fetchall()
-        now = datetime.now(timezone.utc)
-        out = []
-        for r in rows:
-            s = r["next_run_at"]
-            try:
-                dt = _parse_iso_to_utc(s)
-            except (ValueError, TypeError):
-                # можно логировать ошибку парсинга, но не ломать цикл
-                continue
-
-            if dt <= now:
-                out.append(r["task_id"])
-                if len(out) >= limit:
-                    break
-
-        return out
-    finally:
-        conn.close()
+    now = now_epoch()
+    rows = get_task_store().claim(now, limit, INSTANCE_ID, now + settings.LEASE_SECONDS)
+    for row in rows:
+        leases.acquired(row["task_id"], row["lease_token"])
+    return rows
 
 def try_lock_task(task_id: int) -> bool:
-    """Атомарно пометить processing=1 и locked_at, если он был 0."""
-    conn = db_connect()
-    try:
-        cur = conn.execute(
-            "UPDATE active_tasks SET processing = 1, locked_at = ? WHERE task_id = ? AND processing = 0",
-            (to_iso(now_utc()), task_id)
-        )
-        conn.commit()
-        return cur.rowcount == 1
-    finally:
-        conn.close()
+    """Атомарно пометить processing=1 и арендовать задачу, если она была свободна."""
+    now = now_epoch()
+    token = get_task_store().try_lock(task_id, now, INSTANCE_ID, now + settings.LEASE_SECONDS)
+    if token is None:
+        return False
+    leases.acquired(task_id, token)
+    return True
+
+
+def _lease_lost(task_id: int, action: str):
+    logger.warning("Task %s: %s skipped, the lease is no longer held by this instance.", task_id, action)
+    leases.retire(task_id)
+
+
+def delete_task(task_id: int) -> bool:
+    """Удалить задачу; если она арендована этим процессом — только при действующей аренде."""
+    fence = leases.fence(task_id)
+    deleted = get_task_store().delete(task_id, fence)
+    if fence and not deleted:
+        _lease_lost(task_id, "delete")
+        return False
+    leases.settle(task_id)
+    due_timer.remove(task_id)
+    return deleted
+
+def _slot_hash(task_id: int) -> int:
+    # мультипликативный хэш Кнута: соседние task_id попадают в далёкие слоты
+    return (int(task_id) * 2654435761) % 2 ** 32
+
+
+def allocate_slot(task_id: int, window_start: int, slot_load: SlotLoad) -> int:
+    """
+    Выбрать next_run_at (epoch) внутри окна [window_start, window_start + RESCHEDULE_WINDOW_MINUTES).
+
+    Окно делится на слоты по RESCHEDULE_SLOT_SECONDS. Предпочтительный слот детерминирован
+    по task_id. Если RESCHEDULE_SLOT_CAPACITY > 0, занятые слоты (уже >= capacity задач,
+    по slot_load хранилища) пропускаются по кругу; если заполнены все — остаётся предпочтительный.
+    """
+    window = max(settings.RESCHEDULE_WINDOW_MINUTES * 60, 1)
+    slot_seconds = min(max(settings.RESCHEDULE_SLOT_SECONDS, 1), window)
+    slots = window // slot_seconds
+    h = _slot_hash(task_id)
+    preferred = h % slots
+    within_slot = (h // slots) % slot_seconds
+
+    capacity = settings.RESCHEDULE_SLOT_CAPACITY
+    if capacity <= 0:
+        return window_start + preferred * slot_seconds + within_slot
+
+    load = slot_load(window_start, slot_seconds, slots, task_id)
+    for shift in range(slots):
+        slot = (preferred + shift) % slots
+        if load.get(slot, 0) < capacity:
+            return window_start + slot * slot_seconds + within_slot
+    return window_start + preferred * slot_seconds + within_slot
 
-def delete_task(task_id: int):
-    conn = db_connect()
-    try:
-        conn.execute("DELETE FROM active_tasks WHERE task_id = ?", (task_id,))
-        conn.commit()
-    finally:
-        conn.close()
 
 def bump_step_and_reschedule(task_id: int, step: int, tz_name: str = "Europe/Moscow"):
     """
-    Обновляет step и ставит next_run_at на ближайший будущий 11:30 по tz_name (MSK по умолчанию).
-    Всегда игнорирует любые относительные offsets — всегда назначаем 11:30.
+    Обновляет step и ставит next_run_at на завтра в окно RESCHEDULE_TIME
+    + RESCHEDULE_WINDOW_MINUTES по tz_name (MSK по умолчанию), слот выбирает allocate_slot.
+    Относительные offsets игнорируются.
     """
-    conn = db_connect()
     try:
-        try:
-            tz = ZoneInfo(tz_name)
-        except Exception:
-            logger.warning("ZoneInfo('%s') не найдена, используем UTC", tz_name)
-            tz = timezone.utc
+        tz = ZoneInfo(tz_name)
+    except Exception:
+        logger.warning("ZoneInfo('%s') не найдена, используем UTC", tz_name)
+        tz = timezone.utc
 
-        now_local = datetime.now(tz)
-        today_1130 = datetime.combine(now_local.date(), time(11, 30), tzinfo=tz)
+    window_time = time.fromisoformat(settings.RESCHEDULE_TIME)
+    now_local = datetime.now(tz)
+    today_start = datetime.combine(now_local.date(), window_time, tzinfo=tz)
 
-        next_local = today_1130 + timedelta(days=1)
+    window_start_local = today_start + timedelta(days=1)
+    window_start = to_epoch(window_start_local)
 
-        next_run_utc = next_local.astimezone(timezone.utc)
+    fence = leases.fence(task_id)
+    next_run = get_task_store().reschedule(
+        task_id, step, lambda slot_load: allocate_slot(task_id, window_start, slot_load), fence
+    )
+    if next_run is None:
+        if fence:
+            _lease_lost(task_id, "reschedule")
+        return
 
-        logger.debug(
-            "[task_id=%s] next_run_local=%s (%s) | next_run_utc=%s | now_local=%s | now_utc=%s",
-            task_id,
-            next_local.isoformat(), tz.key, # type: ignore
-            next_run_utc.isoformat(),
-            datetime.now(tz).isoformat(),
-            datetime.now(timezone.utc).isoformat()
-        )
+    logger.debug(
+        "[task_id=%s] window_start_local=%s (%s) | next_run_utc=%s | now_utc=%s",
+        task_id,
+        window_start_local.isoformat(), tz,
+        datetime.fromtimestamp(next_run, timezone.utc).isoformat(),
+        datetime.now(timezone.utc).isoformat()
+    )
+    leases.settle(task_id)
+    due_timer.schedule(task_id, next_run)
 
-        conn.execute(
-            "UPDATE active_tasks SET step=?, next_run_at = ?, processing = 0, locked_at = NULL WHERE task_id = ?",
-            (step, to_iso(next_run_utc), task_id)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+def retry_backoff(attempt: int) -> int:
+    """Экспоненциальная задержка перед попыткой attempt (1, 2, ...) с разбросом ±RETRY_JITTER."""
+    delay = min(settings.RETRY_BASE_DELAY * 2 ** (attempt - 1), settings.RETRY_MAX_DELAY)
+    jitter = delay * settings.RETRY_JITTER
+    return max(1, round(delay + random.uniform(-jitter, jitter)))
+
+
+def schedule_retry(task_id: int) -> int:
+    """
+    Перенести задачу после сбоя: увеличить retry_attempts, сохранить backoff,
+    поставить next_run_at = now + backoff и снять блокировку (с проверкой аренды).
+    Возвращает задержку в секундах.
+    """
+    fence = leases.fence(task_id)
+    result = get_task_store().retry(task_id, now_epoch(), retry_backoff, fence)
+    if result is None:
+        if fence:
+            _lease_lost(task_id, "retry")
+        return 0
+    attempt, delay, next_run_at = result
+    leases.settle(task_id)
+    logger.info("Task %s rescheduled after failure: attempt=%s, retry in %s s.", task_id, attempt, delay)
+    due_timer.schedule(task_id, next_run_at)
+    return delay
+
+def release_lock(task_id: int) -> bool:
+    """Снять блокировку без переноса срока (с проверкой аренды)."""
+    fence = leases.fence(task_id)
+    unlocked = get_task_store().unlock(task_id, fence)
+    if fence and not unlocked:
+        _lease_lost(task_id, "unlock")
+        return False
+    leases.settle(task_id)
+    return unlocked
 
 def set_step(task_id: int, step: int):
-    conn = db_connect()
-    try:
-        conn.execute("UPDATE active_tasks SET step = ? WHERE task_id = ?", (step, task_id))
-        conn.commit()
-    finally:
-        conn.close()
+    get_task_store().set_step(task_id, step, leases.fence(task_id))
 
 def get_task_row(task_id: int):
-    conn = db_connect()
-    try:
-        cur = conn.execute("SELECT * FROM active_tasks WHERE task_id = ?", (task_id,))
-        return cur.fetchone()
-    finally:
-        conn.close()
+    return get_task_store().get(task_id)
 
 
 def recover_stale_locks():
-    expiry = now_utc() - timedelta(minutes=settings.LOCK_EXPIRY_MINUTES)
-    conn = db_connect()
-    try:
-        cur = conn.execute("SELECT task_id FROM active_tasks WHERE processing = 1 AND locked_at <= ?", (to_iso(expiry),))
-        stale = [r["task_id"] for r in cur.fetchall()]
-        if stale:
-            logger.info("Recovering stale locks for tasks: %s", stale)
-            conn.executemany("UPDATE active_tasks SET processing = 0, locked_at = NULL WHERE task_id = ?", [(tid,) for tid in stale])
-            conn.commit()
-    finally:
-        conn.close()
\ No newline at end of file
+    """
+    Освободить задачи с истёкшей арендой (владелец упал или перестал продлевать).
+    Блокировки без аренды (до миграции v4) освобождаются по LOCK_EXPIRY_MINUTES.
+    lease_token не сбрасывается: следующий захват увеличит его, и запись прежнего
+    владельца не пройдёт проверку.
+    """
+    now = now_epoch()
+    stale = get_task_store().recover_stale(now, now - settings.LOCK_EXPIRY_MINUTES * 60)
+    if stale:
+        logger.info("Recovering stale locks for tasks: %s", stale)
+        now = now_epoch()
+        for task_id in stale:
+            due_timer.schedule(task_id, now)
@@ -0,0 +1,184 @@
+"""
+Постоянный диспетчер задач (SCANNER_ENGINE="dispatcher").
+
+В отличие от scanner_job, который ждёт завершения всей пачки, диспетчер держит
+в работе не больше DISPATCHER_WINDOW задач и захватывает новые, как только
+освобождается место. Медленная задача занимает один слот, а не весь проход.
+Между задачами диспетчер спит до ближайшего next_run_at по due_timer (или до
+вставки более ранней задачи), БД при простое опрашивается раз в DISPATCHER_IDLE_POLL.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.db_utils import claim_due_tasks, count_due_tasks, recover_stale_locks
+from app.due_timer import due_timer
+from app.lease import leases
+from app.metrics import DISPATCHER_IN_FLIGHT, DISPATCHER_UTILIZATION, REGISTRY, SCAN_CLAIMED
+from app.process_task import process_task
+from app.pyrus_api import get_token
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Цикл диспетчера в отдельном потоке.
+
+    Захватывает до (window - in_flight) готовых задач и отдаёт их в пул потоков.
+    Завершение задачи и более ранний срок в due_timer будят цикл. Если задач нет,
+    цикл спит до ближайшего срока, но не дольше DISPATCHER_IDLE_POLL.
+    stats() отдаёт глубину очереди, число задач в работе и загрузку потоков.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = window or settings.DISPATCHER_WINDOW or settings.MAX_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.window, thread_name_prefix="dispatch")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._in_flight = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+        self._queue_depth = 0
+        self._report_started = time.monotonic()
+        self._report_busy = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        due_timer.subscribe(self.wake)
+        # в памяти — только сроки ближайших двух опросов; дальше таймер продлевается на опросе
+        due_timer.load(2 * settings.DISPATCHER_IDLE_POLL)
+        REGISTRY.add_collector(self.collect_metrics)
+        self._thread = threading.Thread(target=self._run, name="dispatcher", daemon=True)
+        self._thread.start()
+        logger.info("Dispatcher started with a window of %s task(s).", self.window)
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def wake(self):
+        """Разбудить цикл (например, появилась задача, которая уже готова к выполнению)."""
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "window": self.window,
+                "in_flight": in_flight,
+                "utilization": in_flight / self.window,
+                "queue_depth": self._queue_depth,
+                "started": self._started,
+                "completed": self._completed,
+                "failed": self._failed,
+                "busy_seconds": self._busy_seconds,
+            }
+
+    def collect_metrics(self):
+        stats = self.stats()
+        DISPATCHER_IN_FLIGHT.set(stats["in_flight"])
+        DISPATCHER_UTILIZATION.set(stats["utilization"])
+
+    def _free_slots(self) -> int:
+        with self._lock:
+            return self.window - self._in_flight
+
+    def _submit(self, row, auth_token: str):
+        with self._lock:
+            self._in_flight += 1
+            self._started += 1
+        self._executor.submit(self._run_task, row, auth_token)
+
+    def _run_task(self, row, auth_token: str):
+        tid = row["task_id"]
+        started = time.monotonic()
+        ok = False
+        try:
+            process_task(tid, auth_token, row)
+            ok = True
+            logger.info("Task #%s finished successfully.", tid)
+        except Exception:
+            logger.exception("Error during processing of task #%s.", tid)
+        finally:
+            leases.release(tid)
+            with self._lock:
+                self._in_flight -= 1
+                self._busy_seconds += time.monotonic() - started
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+            self._wakeup.set()
+
+    def _report(self):
+        now = time.monotonic()
+        elapsed = now - self._report_started
+        if elapsed < settings.DISPATCHER_REPORT_INTERVAL:
+            return
+        stats = self.stats()
+        busy = stats["busy_seconds"] - self._report_busy
+        logger.info(
+            "Dispatcher: queue depth %s, in flight %s/%s, utilization %.0f%%, completed %s, failed %s.",
+            stats["queue_depth"], stats["in_flight"], self.window,
+            100 * min(busy / (elapsed * self.window), 1.0), stats["completed"], stats["failed"],
+        )
+        self._report_started = now
+        self._report_busy = stats["busy_seconds"]
+
+    def _tick(self) -> bool:
+        """Один шаг цикла. Возвращает True, если захвачены новые задачи."""
+        free = self._free_slots()
+        if free <= 0:
+            return False
+
+        due_timer.pop_due()
+        auth_token = get_token(settings.LOGIN, settings.SECURITY_KEY)
+        claimed = claim_due_tasks(free)
+        if claimed:
+            SCAN_CLAIMED.inc(len(claimed))
+        for row in claimed:
+            self._submit(row, auth_token)
+        depth = count_due_tasks()
+        with self._lock:
+            self._queue_depth = depth
+        return bool(claimed)
+
+    def _run(self):
+        last_recovery = 0.0
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - last_recovery >= settings.DISPATCHER_IDLE_POLL:
+                    recover_stale_locks()
+                    due_timer.refill()
+                    last_recovery = time.monotonic()
+                claimed = self._tick()
+                self._report()
+            except Exception:
+                logger.exception("Dispatcher iteration failed.")
+                claimed = False
+
+            free = self._free_slots()
+            if claimed and free > 0:
+                # возможно, в очереди есть ещё готовые задачи — добираем без ожидания
+                continue
+            if free <= 0:
+                # окно занято — ждём завершения задачи, наступившие сроки подождут
+                self._wakeup.wait(settings.DISPATCHER_IDLE_POLL)
+            else:
+                self._wakeup.wait(due_timer.seconds_until_next(settings.DISPATCHER_IDLE_POLL))
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,137 @@
+"""
+Таймер ближайшего next_run_at для диспетчера.
+
+В памяти хранится min-heap (next_run_at, task_id) сроков в пределах горизонта
+(now + horizon). При старте он загружается из хранилища задач (app.task_store),
+затем его обновляют insert_task/register_task, bump_step_and_reschedule,
+schedule_retry и delete_task; диспетчер периодически продлевает горизонт (refill).
+Более поздние сроки в памяти не держатся. Диспетчер спит до ближайшего срока или
+до появления более ранней задачи, а не опрашивает БД каждые SCAN_INTERVAL секунд.
+"""
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.task_store import get_task_store
+from app.utils import now_epoch
+
+logger = logging.getLogger(__name__)
+
+
+class DueTimer:
+    """
+    Потокобезопасная куча сроков с ленивым удалением.
+
+    Актуальный срок задачи хранится в _due; записи кучи, которые с ним не совпадают,
+    отбрасываются при чтении. Пока load() не вызван, таймер выключен и обновления
+    игнорируются (движки без диспетчера его не используют).
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int]] = []
+        self._due: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._horizon = 0
+        self._horizon_end = 0
+        self.enabled = False
+
+    def subscribe(self, callback: Callable[[], None]):
+        """callback вызывается, когда ближайший срок сдвигается раньше."""
+        self._listeners.append(callback)
+
+    def load(self, horizon: int):
+        """Загрузить сроки незахваченных задач на horizon секунд вперёд и включить таймер."""
+        self._horizon = horizon
+        # включаем до чтения: вставки, сделанные во время загрузки, не потеряются
+        self.enabled = True
+        self.refill()
+        logger.info("Due timer loaded %s task(s) due within %s s.", len(self._due), horizon)
+
+    def refill(self):
+        """Продлить горизонт до now + horizon и догрузить из хранилища попавшие в него сроки."""
+        if not self.enabled:
+            return
+        until = now_epoch() + self._horizon
+        # горизонт сдвигается до чтения: schedule() во время чтения не отбросит новые сроки
+        self._horizon_end = max(self._horizon_end, until)
+        pending = get_task_store().pending_deadlines(until)
+        with self._lock:
+            for task_id, next_run_at in pending.items():
+                if task_id not in self._due:
+                    self._due[task_id] = next_run_at
+                    heapq.heappush(self._heap, (next_run_at, task_id))
+        self._notify()
+
+    def _head(self) -> Optional[int]:
+        while self._heap:
+            ts, tid = self._heap[0]
+            if self._due.get(tid) == ts:
+                return ts
+            heapq.heappop(self._heap)
+        return None
+
+    def _compact(self):
+        # после множества переносов в куче копятся устаревшие записи
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(ts, tid) for tid, ts in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def schedule(self, task_id: int, next_run_at: int):
+        if not self.enabled:
+            return
+        if next_run_at > self._horizon_end:
+            # срок за горизонтом: его догрузит refill, прежний срок задачи больше не действует
+            self.remove(task_id)
+            return
+        with self._lock:
+            head = self._head()
+            self._due[task_id] = next_run_at
+            heapq.heappush(self._heap, (next_run_at, task_id))
+            self._compact()
+            earlier = head is None or next_run_at < head
+        if earlier:
+            self._notify()
+
+    def remove(self, task_id: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._due.pop(task_id, None)
+
+    def pop_due(self, now: Optional[int] = None) -> int:
+        """Снять с таймера все наступившие сроки (их задачи забирает claim_due_tasks)."""
+        now = now_epoch() if now is None else now
+        popped = 0
+        with self._lock:
+            while True:
+                head = self._head()
+                if head is None or head > now:
+                    break
+                _, tid = heapq.heappop(self._heap)
+                self._due.pop(tid, None)
+                popped += 1
+        return popped
+
+    def seconds_until_next(self, limit: float) -> float:
+        """Сколько спать до ближайшего срока, не больше limit."""
+        with self._lock:
+            head = self._head()
+        if head is None:
+            return limit
+        return min(max(head - time.time(), 0.0), limit)
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Due timer listener failed.")
+
+
+due_timer = DueTimer()
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import metrics, rate_limit
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Connection": "keep-alive",
+    "User-Agent": "schedule-bot",
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    """
+    Сессия с пулом keep-alive соединений.
+    pool_connections — число хостов (auth + api), pool_maxsize — соединений на хост.
+    При pool_block=True поток ждёт свободное соединение, а не открывает лишнее.
+    """
+    pool_size = settings.HTTP_POOL_SIZE or settings.MAX_WORKERS
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_HOSTS,
+        pool_maxsize=pool_size,
+        pool_block=settings.HTTP_POOL_BLOCK,
+        max_retries=0,
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Общая для всех потоков сессия (создаётся при первом обращении)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request(method: str, url: str, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    Выполнить запрос через общий пул соединений и ограничитель частоты.
+    endpoint — класс запроса (rate_limit.READ/WRITE/AUTH), по умолчанию по методу.
+    На 429 класс приостанавливается по Retry-After и запрос повторяется
+    до RATE_LIMIT_MAX_RETRIES раз; последний ответ 429 возвращается вызывающему.
+    """
+    endpoint = endpoint or rate_limit.endpoint_class(method)
+    bucket = rate_limit.get_bucket(endpoint)
+    for attempt in range(settings.RATE_LIMIT_MAX_RETRIES + 1):
+        bucket.acquire()
+        started = time.perf_counter()
+        try:
+            resp = get_session().request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.observe_pyrus_request(method, url, "error", time.perf_counter() - started)
+            raise
+        metrics.observe_pyrus_request(method, url, resp.status_code, time.perf_counter() - started)
+        if resp.status_code != 429:
+            return resp
+        rate_limit.throttled(endpoint, resp.headers.get("Retry-After"))
+        if attempt < settings.RATE_LIMIT_MAX_RETRIES:
+            resp.close()
+            logger.info("Retrying %s %s after 429 (%s/%s).", method, url,
+                        attempt + 1, settings.RATE_LIMIT_MAX_RETRIES)
+    return resp
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
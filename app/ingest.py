@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from app.db_utils import register_tasks
+from app.timestamps import to_epoch
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PendingInsert:
+    """Задача, ожидающая записи в БД; done выставляется после commit её пачки."""
+
+    __slots__ = ("task_id", "due", "next_run", "done", "changed", "error")
+
+    def __init__(self, task_id: int, due: int, next_run: int):
+        self.task_id = task_id
+        self.due = due
+        self.next_run = next_run
+        self.done = threading.Event()
+        self.changed: Optional[bool] = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Дождаться commit. Возвращает True, если строка записана, False — если ничего не изменилось.
+        Бросает TimeoutError или ошибку записи пачки.
+        """
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Task #{self.task_id} was not committed within {timeout} s")
+        if self.error is not None:
+            raise self.error
+        return bool(self.changed)
+
+
+class IngestBuffer:
+    """
+    Write-behind буфер вставок из вебхука.
+
+    Фоновый поток собирает принятые задачи и пишет их одной транзакцией
+    (register_tasks — upsert по REGISTER_CONFLICT_POLICY) каждые flush_interval_ms
+    или по batch_size строк.
+    Вызывающий поток ждёт commit своей пачки, поэтому ответ 200 остаётся надёжным.
+    """
+
+    def __init__(self, flush_interval_ms: int, batch_size: int):
+        self._flush_interval = flush_interval_ms / 1000
+        self._batch_size = batch_size
+        self._queue: "queue.Queue[PendingInsert]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, task_id: int, due_iso: str, next_run_iso: str) -> PendingInsert:
+        # даты разбираем в потоке запроса: ошибка формата не должна ронять всю пачку
+        pending = PendingInsert(task_id, to_epoch(due_iso), to_epoch(next_run_iso))
+        self._ensure_started()
+        self._queue.put(pending)
+        return pending
+
+    def register(self, task_id: int, due_iso: str, next_run_iso: str) -> bool:
+        """Поставить задачу в буфер и дождаться commit (результат как у db_utils.register_task)."""
+        return self.submit(task_id, due_iso, next_run_iso).wait(settings.INGEST_ACK_TIMEOUT)
+
+    def _collect(self) -> List[PendingInsert]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[PendingInsert]):
+        try:
+            results = register_tasks((p.task_id, p.due, p.next_run) for p in batch)
+            for pending, changed in zip(batch, results):
+                pending.changed = changed
+            logger.debug("Ingest batch of %s task(s) committed.", len(batch))
+        except Exception as e:
+            logger.exception("Failed to commit ingest batch of %s task(s).", len(batch))
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def _run(self):
+        while True:
+            self._flush(self._collect())
+
+
+ingest_buffer = IngestBuffer(settings.INGEST_FLUSH_MS, settings.INGEST_BATCH_SIZE)
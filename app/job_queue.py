@@ -0,0 +1,174 @@
+"""
+Надёжная очередь фоновых заданий в SQLite (таблица jobs).
+
+Вебхук только ставит задание в очередь и сразу отвечает 200; обращения к Pyrus
+выполняют отдельные рабочие потоки (JOB_WORKERS) со своим бюджетом. Неудачные
+задания переносятся с экспоненциальной задержкой, после JOB_MAX_ATTEMPTS
+остаются в таблице со status='failed', пока то же задание не поставят снова.
+"""
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from app.db_connect import db_connect
+from app.db_utils import retry_backoff
+from app.lease import INSTANCE_ID
+from app.pyrus_api import single_attempt
+from app.subject import set_client_to_task
+from app.utils import now_epoch
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+JOB_SET_CLIENT = "set_client"
+
+_handlers: Dict[str, Callable[[dict], None]] = {}
+_wakeup = threading.Event()
+_workers: List[threading.Thread] = []
+
+
+def job_handler(kind: str):
+    """Декоратор: зарегистрировать обработчик заданий вида kind."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind: str, dedup_key, payload: dict) -> bool:
+    """
+    Поставить задание в очередь. Задание с тем же (kind, dedup_key) одно:
+    ожидающее или выполняемое получает новый payload (выполняемое после завершения
+    запустится ещё раз с ним), проваленное (failed) ставится заново с нуля попыток.
+    Возвращает True, если задание добавлено или изменено.
+    """
+    now = now_epoch()
+    with db_connect() as conn:
+        cur = conn.execute(
+            "INSERT INTO jobs (kind, dedup_key, payload, next_run_at, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(kind, dedup_key) DO UPDATE SET payload = excluded.payload, "
+            "status = CASE WHEN jobs.status = 'failed' THEN 'pending' ELSE jobs.status END, "
+            "attempts = CASE WHEN jobs.status = 'failed' THEN 0 ELSE jobs.attempts END, "
+            "next_run_at = CASE WHEN jobs.status = 'failed' THEN excluded.next_run_at ELSE jobs.next_run_at END "
+            "WHERE jobs.status = 'failed' OR jobs.payload != excluded.payload",
+            (kind, str(dedup_key), json.dumps(payload), now, now)
+        )
+        added = cur.rowcount == 1
+    if added:
+        _wakeup.set()
+    return added
+
+
+def _claim_job():
+    now = now_epoch()
+    with db_connect() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'running', locked_at = ?, locked_by = ?, attempts = attempts + 1 WHERE id = ("
+            "SELECT id FROM jobs WHERE status = 'pending' AND next_run_at <= ? ORDER BY next_run_at LIMIT 1) "
+            "RETURNING *",
+            (now, INSTANCE_ID, now)
+        )
+        return cur.fetchone()
+
+
+def _complete_job(job) -> bool:
+    """Удалить выполненное задание. Если за время выполнения пришёл новый payload — вернуть его в очередь."""
+    with db_connect() as conn:
+        cur = conn.execute("DELETE FROM jobs WHERE id = ? AND payload = ?", (job["id"], job["payload"]))
+        if cur.rowcount == 1:
+            return True
+        conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, next_run_at = ?, locked_at = NULL WHERE id = ?",
+            (now_epoch(), job["id"])
+        )
+    return False
+
+
+def _fail_job(job, error: BaseException):
+    attempts = job["attempts"]
+    status = "failed" if attempts >= settings.JOB_MAX_ATTEMPTS else "pending"
+    delay = retry_backoff(attempts)
+    with db_connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, next_run_at = ?, locked_at = NULL, last_error = ? WHERE id = ?",
+            (status, now_epoch() + delay, repr(error)[:1000], job["id"])
+        )
+    if status == "failed":
+        logger.error("Job #%s (%s) failed after %s attempts: %r", job["id"], job["kind"], attempts, error)
+    else:
+        logger.warning("Job #%s (%s) attempt %s failed, retry in %s s: %r",
+                       job["id"], job["kind"], attempts, delay, error)
+
+
+def recover_stale_jobs(startup: bool = False):
+    """
+    Вернуть в очередь задания, зависшие в running дольше JOB_LOCK_SECONDS (упавший процесс).
+    При startup=True — ещё и все running-задания этого INSTANCE_ID: в новом процессе их никто
+    не выполняет (при стабильном INSTANCE_ID они возвращаются сразу, без ожидания срока).
+    """
+    expiry = now_epoch() - settings.JOB_LOCK_SECONDS
+    with db_connect() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'pending', locked_at = NULL, locked_by = NULL "
+            "WHERE status = 'running' AND (locked_at <= ? OR (? AND locked_by = ?)) RETURNING id",
+            (expiry, startup, INSTANCE_ID)
+        )
+        stale = [r["id"] for r in cur.fetchall()]
+    if stale:
+        logger.info("Recovering stale jobs: %s", stale)
+
+
+def run_pending_job() -> bool:
+    """Выполнить одно готовое задание. Возвращает False, если очередь пуста."""
+    job = _claim_job()
+    if job is None:
+        return False
+
+    handler = _handlers.get(job["kind"])
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job kind {job['kind']!r}")
+        # один вызов API на попытку: повторы — через JOB_MAX_ATTEMPTS и backoff очереди,
+        # а не sleep внутри retry_on_exception, занимающий рабочий поток на минуты
+        with single_attempt():
+            handler(json.loads(job["payload"]))
+    except Exception as e:
+        _fail_job(job, e)
+    else:
+        if _complete_job(job):
+            logger.info("Job #%s (%s) done.", job["id"], job["kind"])
+        else:
+            logger.info("Job #%s (%s) done, requeued with the payload received meanwhile.", job["id"], job["kind"])
+    return True
+
+
+def _worker_loop():
+    while True:
+        try:
+            if run_pending_job():
+                continue
+            # очередь пуста — заодно вернуть задания, зависшие у упавших процессов
+            recover_stale_jobs()
+        except Exception:
+            logger.exception("Job worker failed to process the queue.")
+        # ждём новое задание из вебхука или следующий опрос (переносы по backoff, другие процессы)
+        _wakeup.wait(settings.JOB_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_job_workers(count: Optional[int] = None):
+    """Запустить рабочие потоки очереди (один раз на процесс)."""
+    if _workers:
+        return
+    recover_stale_jobs(startup=True)
+    for i in range(count or settings.JOB_WORKERS):
+        worker = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    logger.info("Started %s job worker(s).", len(_workers))
+
+
+@job_handler(JOB_SET_CLIENT)
+def _set_client_job(payload: dict):
+    set_client_to_task(payload["parent_task_id"], payload["task_id"])
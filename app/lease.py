@@ -0,0 +1,131 @@
+"""
+Аренда (lease) задач для нескольких процессов-сканеров на одной БД.
+
+claim_due_tasks записывает в задачу владельца (INSTANCE_ID), срок аренды
+lease_expires_at и увеличивает lease_token (fencing token). Пока задача в работе,
+фоновый поток продлевает аренду каждые LEASE_HEARTBEAT_SECONDS. Записи о
+результате (перенос, удаление, снятие блокировки) выполняются только с условием
+lease_owner/lease_token. Если аренду успели перехватить после истечения,
+устаревший владелец ничего не перезапишет.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Dict, Optional, Set, Tuple
+
+from app.task_store import get_task_store
+from app.utils import now_epoch
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_ID = settings.INSTANCE_ID or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseKeeper:
+    """
+    Аренды, которыми владеет этот процесс: task_id -> lease_token, и поток продления.
+
+    После записи результата или потери аренды (перехвачена после истечения) задача
+    выводится из продления (retire), но её token помнится до release() в конце
+    прохода: повторные записи того же прохода тоже проверяются по аренде.
+    Задачи, результат прохода по которым уже записан (settle), повторно не освобождаются.
+    """
+
+    def __init__(self, owner: str):
+        self.owner = owner
+        self._held: Dict[int, int] = {}
+        self._retired: Dict[int, int] = {}
+        self._settled: Set[int] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def acquired(self, task_id: int, token: int):
+        with self._lock:
+            self._held[task_id] = token
+            self._retired.pop(task_id, None)
+            self._settled.discard(task_id)
+        self._ensure_heartbeat()
+
+    def release(self, task_id: int):
+        """Проход по задаче завершён: забыть аренду."""
+        with self._lock:
+            self._held.pop(task_id, None)
+            self._retired.pop(task_id, None)
+            self._settled.discard(task_id)
+
+    def retire(self, task_id: int):
+        """Перестать продлевать аренду; token остаётся для проверки записей до release()."""
+        with self._lock:
+            token = self._held.pop(task_id, None)
+            if token is not None:
+                self._retired[task_id] = token
+
+    def settle(self, task_id: int):
+        """
+        Результат прохода записан этим процессом (перенос, повтор, удаление, снятие блокировки):
+        как retire, и до release() задача считается уже освобождённой.
+        """
+        with self._lock:
+            token = self._held.pop(task_id, None)
+            if token is not None:
+                self._retired[task_id] = token
+            if task_id in self._retired:
+                self._settled.add(task_id)
+
+    def settled(self, task_id: int) -> bool:
+        with self._lock:
+            return task_id in self._settled
+
+    def token(self, task_id: int) -> Optional[int]:
+        with self._lock:
+            token = self._held.get(task_id)
+            return token if token is not None else self._retired.get(task_id)
+
+    def fence(self, task_id: int) -> Optional[Tuple[str, int]]:
+        """
+        Условие для записи по задаче: только текущий владелец с тем же fencing token.
+        Если задача этим процессом не арендована (ручной вызов), условия нет (None).
+        """
+        token = self.token(task_id)
+        if token is None:
+            return None
+        return self.owner, token
+
+    def held(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(self._held)
+
+    def renew(self) -> int:
+        """Продлить все аренды процесса; перехваченные выводятся из продления. Возвращает число продлённых."""
+        held = self.held()
+        if not held:
+            return 0
+        lost = get_task_store().renew_leases(self.owner, held, now_epoch() + settings.LEASE_SECONDS)
+        for task_id in lost:
+            # задача могла быть уже завершена между held() и UPDATE — тогда её уже нет в _held
+            with self._lock:
+                if self._held.get(task_id) == held[task_id]:
+                    self._retired[task_id] = self._held.pop(task_id)
+                    logger.warning("Lease for task %s was lost (expired and taken over).", task_id)
+        return len(held) - len(lost)
+
+    def _ensure_heartbeat(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+                    self._thread.start()
+
+    def _heartbeat(self):
+        while not self._stop.wait(settings.LEASE_HEARTBEAT_SECONDS):
+            try:
+                self.renew()
+            except Exception:
+                logger.exception("Failed to renew task leases.")
+
+
+leases = LeaseKeeper(INSTANCE_ID)
@@ -1,17 +1,30 @@
 import logging
 
-from app.db_utils import db_connect
+from app.db_utils import release_lock, schedule_retry
+from app.due_timer import due_timer
+from app.lease import leases
+from app.utils import now_epoch
+from conf.config import settings
 
 logger = logging.getLogger(__name__)
 
 def unlock_task(task_id: int):
-    conn = db_connect()
-    try:
-        conn.execute(
-            "UPDATE active_tasks SET processing = 0, locked_at = NULL WHERE task_id = ?",
-            (task_id,)
-        )
-        conn.commit()
-        logger.info("Task %s has been unlocked.", task_id)
-    finally:
-        conn.close()
\ No newline at end of file
+    if not release_lock(task_id):
+        return
+    logger.info("Task %s has been unlocked.", task_id)
+    # срок уже наступил; через таймер повторяем не раньше следующего скана, как раньше
+    due_timer.schedule(task_id, now_epoch() + settings.SCAN_INTERVAL)
+
+def release_after_failure(task_id: int):
+    """
+    Освободить задачу после сбоя обработки.
+    RETRY_MODE="reschedule": перенести с backoff (schedule_retry), иначе просто снять блокировку.
+    Если задачу уже освободили в этом проходе (retry_on_exception после всех попыток), ничего не делает.
+    """
+    if leases.settled(task_id):
+        logger.debug("Task %s is already released in this pass.", task_id)
+        return
+    if settings.RETRY_MODE == "reschedule":
+        schedule_retry(task_id)
+    else:
+        unlock_task(task_id)
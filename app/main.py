@@ -1,36 +1,78 @@
-from app.subject import set_client_to_task
 from conf.logging_config import conf_logger
 import logging
 import sqlite3
-from datetime import timezone
-from dateutil.parser import isoparse
-from flask import Flask, jsonify, request
+import time
+from flask import Flask, Response, g, jsonify, request
 from waitress import serve  
 
-from app.db_utils import has_task, init_db, insert_task 
+from app import metrics, timestamps
+from app.db_utils import init_db, queue_stats, register_task
+from app.ingest import ingest_buffer
+from app.job_queue import JOB_SET_CLIENT, enqueue_job, start_job_workers
+from app.pyrus_api import member_cache
 from app.utils import (  
     check_client,
-    create_iso_date_with_duration,
     last_comment_has_bot,
     log_and_abort,
-    normalize_due,
 )
-from app.verify_signature import validate_pyrus_request  
+from app.verify_signature import loads_json, validate_pyrus_request
+from app.webhook_dedup import event_key, webhook_dedup
+from conf.config import settings
 
 app = Flask(__name__)
 
 logger = logging.getLogger(__name__)
 
 
+def collect_queue_metrics():
+    stats = queue_stats()
+    metrics.TASKS_DUE.set(stats["due"])
+    metrics.TASKS_LOCKED.set(stats["locked"])
+    metrics.OLDEST_LOCK_AGE.set(stats["oldest_lock_age"])
+    metrics.TASKS_BY_STEP.replace(({"step": step}, n) for step, n in stats["by_step"].items())
+
+
+def collect_cache_metrics():
+    metrics.collect_caches({"member": member_cache, "webhook_dedup": webhook_dedup})
+
+
+metrics.REGISTRY.add_collector(collect_queue_metrics)
+metrics.REGISTRY.add_collector(collect_cache_metrics)
+
+
+@app.before_request
+def start_webhook_timer():
+    if request.endpoint == "webhook":
+        g.webhook_started = time.perf_counter()
+
+
+@app.after_request
+def observe_webhook(response):
+    started = g.pop("webhook_started", None)
+    if started is not None:
+        metrics.WEBHOOK_LATENCY.observe(time.perf_counter() - started)
+        metrics.WEBHOOK_REQUESTS.inc(status=response.status_code)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
-    data = request.get_json(silent=True)
-    raw = validate_pyrus_request(request, settings.SECURITY_KEY)
+    # подпись проверяется по сырым байтам до разбора: отклонённые запросы не парсятся
+    raw, error = validate_pyrus_request(request, settings.SECURITY_KEY)
+    if error is not None:
+        return error
 
-    if not raw:
-        return log_and_abort("invalid request")
+    try:
+        data = loads_json(raw)
+    except ValueError:
+        data = None
 
-    if not data:
+    if not data or not isinstance(data, dict):
         return log_and_abort("invalid or missing json")
 
     task = data.get("task")
@@ -42,7 +84,27 @@ def webhook():
     if not task_id:
         return log_and_abort("task_id not found")
 
-    logger.info(f"get new task #{task_id}")
+    # повторная доставка уже обработанного события: 200 без разбора дат и обращений к БД
+    key = event_key(data)
+    if key is not None and webhook_dedup.seen(key):
+        metrics.WEBHOOK_DUPLICATES.inc()
+        logger.debug("duplicate event for task #%s, skipping", task_id)
+        return "", 200
+
+    response, persisted = handle_task_event(task, task_id)
+    # повтор отсекаем, только если событие записано; иначе его повторная доставка — шанс обработать
+    if key is not None and persisted:
+        webhook_dedup.mark(key)
+    return response
+
+
+def handle_task_event(task: dict, task_id):
+    """
+    Обработать событие по задаче.
+    Возвращает ((тело, код) ответа вебхука, persisted): persisted — задача зарегистрирована
+    в БД или задание поставлено в очередь.
+    """
+    logger.info("get new task #%s", task_id)
 
     form_id = task.get("form_id")
     
@@ -53,107 +115,119 @@ def webhook():
             has_client = check_client(fields)
             
             if has_client:
-                logger.warning(f"client already is existing in task #{task_id}")
-                return "", 200
+                logger.warning("client already is existing in task #%s", task_id)
+                return ("", 200), False
             
             parent_task_id = task.get("parent_task_id")
             
             if not parent_task_id:
-                logger.warning(f"parent_task_id is missing in task #{task_id}")
-                return "", 200
+                logger.warning("parent_task_id is missing in task #%s", task_id)
+                return ("", 200), False
             
-            set_client_to_task(parent_task_id, task_id)
+            # обновление в Pyrus выполняет фоновый воркер: ответ не ждёт API и его повторов
+            enqueue_job(JOB_SET_CLIENT, task_id, {"parent_task_id": parent_task_id, "task_id": task_id})
             
-            return "", 200
+            return ("", 200), True
             
+        except sqlite3.Error:
+            logger.exception("failed to enqueue client update for task #%s", task_id)
+            return (jsonify({"error": "internal server error"}), 500), False
         except Exception:
-            logger.exception(f"failed to try set user to task #{task_id}")
-            return "", 200       
+            logger.exception("failed to try set user to task #%s", task_id)
+            return ("", 200), False
     
     duration_minutes = task.get("duration")
 
     due = task.get("due") or task.get("due_date")
 
     if not due:
-        return log_and_abort("due not found", task_id)
+        return log_and_abort("due not found", task_id), False
 
-    if not duration_minutes:
-        due = normalize_due(due) if isinstance(due, str) else None
-    elif isinstance(duration_minutes, int):
-        due = create_iso_date_with_duration(due, duration_minutes)
-        due = normalize_due(due)
-
-    create_date_raw = task.get("create_date")
-    last_modified_raw = task.get("last_modified_date")
+    try:
+        if not duration_minutes:
+            due = timestamps.normalize(due) if isinstance(due, str) else None
+        elif isinstance(duration_minutes, int):
+            due = timestamps.shift(due, minutes=duration_minutes)
 
-    create_date = isoparse(create_date_raw) if create_date_raw else None
-    last_modified_date = isoparse(last_modified_raw) if last_modified_raw else None
+        create_date = timestamps.parse_optional(task.get("create_date"))
+        last_modified_date = timestamps.parse_optional(task.get("last_modified_date"))
+    except ValueError:
+        return log_and_abort("failed to parse task dates", task_id), False
 
     if not create_date or not last_modified_date:
-        return log_and_abort("failed to get task #{task_id} update or creation date.")
-
-    create_date_utc = create_date.astimezone(timezone.utc)
-    last_modified_date_utc = last_modified_date.astimezone(timezone.utc)
+        return log_and_abort("failed to get update or creation date", task_id), False
 
     comments = task.get("comments", [])
 
-    is_new_task = create_date_utc == last_modified_date_utc or last_comment_has_bot(
+    # parse_optional уже приводит обе даты к UTC
+    is_new_task = create_date == last_modified_date or last_comment_has_bot(
         comments
     )
 
     if is_new_task:
-        logger.info(f"creation and update dates match in task #{task_id}.")
+        logger.info("creation and update dates match in task #%s.", task_id)
+
+        if not due:
+            return log_and_abort("failed to normalize due date", task_id), False
 
         try:
-            task_exists = has_task(task_id)
-        except Exception:
-            logger.exception(f"Failed to check existence of task #{task_id}.")
-            return jsonify({"error": "internal server error"}), 500
-
-        if not task_exists:
-            try:
-                if not due:
-                    return log_and_abort("failed to normalize due date", task_id)
-                insert_task(task_id, due, due)
-                logger.info(
-                    f"task #{task_id} has been successfully added to the database."
-                )
-                return "", 200
-            except sqlite3.Error:
-                logger.exception(f"Failed to insert task #{task_id} into the database.")
-                return jsonify({"error": "internal server error"}), 500
+            if settings.INGEST_BATCHING:
+                # ждём commit пачки, в которую попала задача: 200 отдаём только после записи
+                changed = ingest_buffer.register(task_id, due, due)
+            else:
+                changed = register_task(task_id, due, due)
+        except ValueError:
+            return log_and_abort("failed to parse due date", task_id), False
+        except (sqlite3.Error, TimeoutError):
+            logger.exception("Failed to insert task #%s into the database.", task_id)
+            return (jsonify({"error": "internal server error"}), 500), False
+
+        if changed:
+            logger.info(
+                "task #%s has been successfully saved to the database.", task_id
+            )
         else:
-            logger.info(f"task #{task_id} already exists in the database.")
+            logger.info("task #%s already exists in the database.", task_id)
+        return ("", 200), True
 
     else:
-        logger.info(f"creation and update dates not match in task #{task_id}")
+        logger.info("creation and update dates not match in task #%s", task_id)
 
-    return "", 200
+    return ("", 200), False
 
 
 if __name__ == "__main__":
     from apscheduler.schedulers.background import BackgroundScheduler
-    from conf.config import settings
 
     from app.scan_tasks import scanner_job
     conf_logger()
     init_db()
+    start_job_workers()
 
-    # Настройка и запуск планировщика
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        scanner_job, "interval", seconds=settings.SCAN_INTERVAL, id="scanner_job"
-    )
-    scheduler.start()
-    logger.debug(
-        "Scheduler started and will run every %s seconds.",
-        settings.SCAN_INTERVAL,
-    )
+    scheduler = None
+    if settings.SCANNER_ENGINE == "dispatcher":
+        from app.dispatcher import dispatcher
+        dispatcher.start()
+    else:
+        # Настройка и запуск планировщика
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(
+            scanner_job, "interval", seconds=settings.SCAN_INTERVAL, id="scanner_job"
+        )
+        scheduler.start()
+        logger.debug(
+            "Scheduler started and will run every %s seconds.",
+            settings.SCAN_INTERVAL,
+        )
 
     try:
         # Запуск веб-сервера
         serve(app, host="0.0.0.0", port=settings.PORT)
     except (KeyboardInterrupt, SystemExit):
         # Корректное завершение работы планировщика
-        scheduler.shutdown()
-        logger.info("Scheduler has been stopped.")
+        if scheduler is not None:
+            scheduler.shutdown()
+            logger.info("Scheduler has been stopped.")
+        else:
+            dispatcher.stop(wait=False)
+            logger.info("Dispatcher has been stopped.")
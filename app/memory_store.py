@@ -0,0 +1,276 @@
+"""
+Хранилище напоминаний в памяти процесса (TASK_STORE="memory").
+
+Записи — dict с теми же ключами, что колонки active_tasks. Индексы:
+    _due_heap   — min-heap (next_run_at, task_id) свободных задач, аналог idx_processing_next_run;
+    _lease_heap — min-heap (lease_expires_at, task_id) захваченных задач для recover_stale;
+    _run_at     — число задач на каждую секунду next_run_at (занятость слотов окна переноса);
+    _by_step    — число задач по шагам (метрики).
+Кучи с ленивым удалением: запись кучи действительна, только пока совпадает с полем задачи.
+Семантика аренды и fencing та же, что у SqliteTaskStore. Состояние не переживает рестарт.
+"""
+import heapq
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from app.task_store import Fence, SlotPicker, TaskStore, TaskTuple
+
+
+def _decrement(counter: Counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class MemoryTaskStore(TaskStore):
+
+    def __init__(self):
+        self._rows: Dict[int, dict] = {}
+        self._due_heap: List[Tuple[int, int]] = []
+        self._lease_heap: List[Tuple[int, int]] = []
+        self._run_at: Counter = Counter()
+        self._by_step: Counter = Counter()
+        self._locked: set = set()
+        self._lock = threading.Lock()
+
+    # --- индексы (вызываются под self._lock) ---
+
+    def _is_pending(self, task_id: int, next_run_at: int) -> bool:
+        row = self._rows.get(task_id)
+        return row is not None and row["processing"] == 0 and row["next_run_at"] == next_run_at
+
+    def _push_due(self, row: dict):
+        heapq.heappush(self._due_heap, (row["next_run_at"], row["task_id"]))
+        # после множества переносов в куче копятся устаревшие записи
+        if len(self._due_heap) > 2 * len(self._rows) + 64:
+            self._due_heap = [(r["next_run_at"], tid) for tid, r in self._rows.items() if r["processing"] == 0]
+            heapq.heapify(self._due_heap)
+
+    def _iter_due(self, now: int) -> Iterator[Tuple[int, int]]:
+        """Действительные записи кучи с next_run_at <= now (обход с отсечением поддеревьев, без порядка)."""
+        heap = self._due_heap
+        stack = [0] if heap else []
+        seen = set()
+        while stack:
+            i = stack.pop()
+            ts, tid = heap[i]
+            if ts > now:
+                continue
+            if tid not in seen and self._is_pending(tid, ts):
+                seen.add(tid)
+                yield ts, tid
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    stack.append(child)
+
+    def _set_run_at(self, row: dict, next_run_at: int):
+        _decrement(self._run_at, row["next_run_at"])
+        row["next_run_at"] = next_run_at
+        self._run_at[next_run_at] += 1
+
+    def _set_step(self, row: dict, step: int):
+        _decrement(self._by_step, row["step"])
+        row["step"] = step
+        self._by_step[step] += 1
+
+    def _acquire(self, row: dict, now: int, owner: str, lease_expires_at: int):
+        row.update(processing=1, locked_at=now, lease_owner=owner, lease_expires_at=lease_expires_at,
+                   lease_token=row["lease_token"] + 1)
+        self._locked.add(row["task_id"])
+        heapq.heappush(self._lease_heap, (lease_expires_at, row["task_id"]))
+
+    def _free(self, row: dict):
+        row.update(processing=0, locked_at=None, lease_owner=None, lease_expires_at=None)
+        self._locked.discard(row["task_id"])
+        self._push_due(row)
+
+    def _fenced(self, task_id: int, fence: Fence) -> Optional[dict]:
+        """Запись задачи, если она есть и (при fence) аренда совпадает."""
+        row = self._rows.get(task_id)
+        if row is None or (fence is not None and (row["lease_owner"], row["lease_token"]) != tuple(fence)):
+            return None
+        return row
+
+    def _slot_load(self, window_start: int, slot_seconds: int, slots: int, exclude_task_id: int) -> Dict[int, int]:
+        load: Dict[int, int] = {}
+        for second in range(window_start, window_start + slots * slot_seconds):
+            n = self._run_at.get(second)
+            if n:
+                slot = (second - window_start) // slot_seconds
+                load[slot] = load.get(slot, 0) + n
+        row = self._rows.get(exclude_task_id)
+        if row is not None and window_start <= row["next_run_at"] < window_start + slots * slot_seconds:
+            slot = (row["next_run_at"] - window_start) // slot_seconds
+            load[slot] -= 1
+        return load
+
+    # --- TaskStore ---
+
+    def _insert(self, task_id: int, due: int, next_run_at: int):
+        row = {
+            "task_id": task_id, "due": due, "next_run_at": next_run_at, "processing": 0, "locked_at": None,
+            "step": 1, "retry_attempts": 0, "retry_backoff": 0,
+            "lease_owner": None, "lease_expires_at": None, "lease_token": 0,
+        }
+        self._rows[task_id] = row
+        self._run_at[next_run_at] += 1
+        self._by_step[1] += 1
+        self._push_due(row)
+
+    def insert(self, task_id: int, due: int, next_run_at: int):
+        with self._lock:
+            if task_id in self._rows:
+                raise ValueError(f"Task {task_id} already exists")
+            self._insert(task_id, due, next_run_at)
+
+    def register_many(self, rows: Iterable[TaskTuple], on_conflict: str) -> List[Optional[int]]:
+        if on_conflict not in ("ignore", "update_due"):
+            raise KeyError(on_conflict)
+        changed = []
+        with self._lock:
+            for task_id, due, next_run_at in rows:
+                row = self._rows.get(task_id)
+                if row is None:
+                    self._insert(task_id, due, next_run_at)
+                    changed.append(next_run_at)
+                elif on_conflict == "update_due" and row["due"] != due:
+                    row["due"] = due
+                    if row["step"] == 1 and row["processing"] == 0:
+                        self._set_run_at(row, next_run_at)
+                        self._push_due(row)
+                    changed.append(row["next_run_at"])
+                else:
+                    changed.append(None)
+        return changed
+
+    def has(self, task_id: int) -> bool:
+        return task_id in self._rows
+
+    def get(self, task_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._rows.get(task_id)
+            return dict(row) if row is not None else None
+
+    def due_ids(self, now: int, limit: int) -> List[int]:
+        with self._lock:
+            return [tid for _, tid in heapq.nsmallest(limit, self._iter_due(now))]
+
+    def count_due(self, now: int) -> int:
+        with self._lock:
+            return sum(1 for _ in self._iter_due(now))
+
+    def claim(self, now: int, limit: int, owner: str, lease_expires_at: int) -> List[dict]:
+        claimed = []
+        with self._lock:
+            while self._due_heap and len(claimed) < limit:
+                ts, tid = self._due_heap[0]
+                if ts > now:
+                    break
+                heapq.heappop(self._due_heap)
+                if not self._is_pending(tid, ts):
+                    continue
+                row = self._rows[tid]
+                self._acquire(row, now, owner, lease_expires_at)
+                claimed.append(dict(row))
+        return claimed
+
+    def try_lock(self, task_id: int, now: int, owner: str, lease_expires_at: int) -> Optional[int]:
+        with self._lock:
+            row = self._rows.get(task_id)
+            if row is None or row["processing"] != 0:
+                return None
+            self._acquire(row, now, owner, lease_expires_at)
+            return row["lease_token"]
+
+    def reschedule(self, task_id: int, step: int, pick_slot: SlotPicker, fence: Fence) -> Optional[int]:
+        with self._lock:
+            next_run = pick_slot(self._slot_load)
+            row = self._fenced(task_id, fence)
+            if row is None:
+                return None
+            self._set_step(row, step)
+            self._set_run_at(row, next_run)
+            row.update(retry_attempts=0, retry_backoff=0)
+            self._free(row)
+            return next_run
+
+    def retry(self, task_id: int, now: int, backoff: Callable[[int], int],
+              fence: Fence) -> Optional[Tuple[int, int, int]]:
+        with self._lock:
+            row = self._fenced(task_id, fence)
+            if row is None:
+                return None
+            attempt = (row["retry_attempts"] or 0) + 1
+            delay = backoff(attempt)
+            row.update(retry_attempts=attempt, retry_backoff=delay)
+            self._set_run_at(row, now + delay)
+            self._free(row)
+            return attempt, delay, now + delay
+
+    def set_step(self, task_id: int, step: int, fence: Fence) -> bool:
+        with self._lock:
+            row = self._fenced(task_id, fence)
+            if row is None:
+                return False
+            self._set_step(row, step)
+            return True
+
+    def delete(self, task_id: int, fence: Fence) -> bool:
+        with self._lock:
+            row = self._fenced(task_id, fence)
+            if row is None:
+                return False
+            del self._rows[task_id]
+            self._locked.discard(task_id)
+            _decrement(self._run_at, row["next_run_at"])
+            _decrement(self._by_step, row["step"])
+            return True
+
+    def unlock(self, task_id: int, fence: Fence) -> bool:
+        with self._lock:
+            row = self._fenced(task_id, fence)
+            if row is None:
+                return False
+            if row["processing"]:
+                self._free(row)
+            return True
+
+    def renew_leases(self, owner: str, held: Mapping[int, int], lease_expires_at: int) -> List[int]:
+        lost = []
+        with self._lock:
+            for task_id, token in held.items():
+                row = self._rows.get(task_id)
+                if row is None or not row["processing"] or (row["lease_owner"], row["lease_token"]) != (owner, token):
+                    lost.append(task_id)
+                    continue
+                row["lease_expires_at"] = lease_expires_at
+                heapq.heappush(self._lease_heap, (lease_expires_at, task_id))
+        return lost
+
+    def recover_stale(self, now: int, legacy_expiry: int) -> List[int]:
+        # задач без аренды (legacy_expiry) здесь не бывает: захват всегда оформляет аренду
+        stale = []
+        with self._lock:
+            while self._lease_heap and self._lease_heap[0][0] <= now:
+                expires_at, tid = heapq.heappop(self._lease_heap)
+                row = self._rows.get(tid)
+                if row is None or not row["processing"] or row["lease_expires_at"] != expires_at:
+                    continue
+                self._free(row)
+                stale.append(tid)
+        return stale
+
+    def pending_deadlines(self, until: int) -> Dict[int, int]:
+        with self._lock:
+            return {tid: ts for ts, tid in self._iter_due(until)}
+
+    def stats(self, now: int) -> dict:
+        with self._lock:
+            oldest = min((self._rows[tid]["locked_at"] for tid in self._locked), default=None)
+            return {
+                "due": sum(1 for _ in self._iter_due(now)),
+                "locked": len(self._locked),
+                "oldest_lock_age": now - oldest if oldest is not None else 0,
+                "by_step": dict(self._by_step),
+            }
@@ -0,0 +1,279 @@
+"""
+Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Counter/Gauge/Histogram с метками регистрируются в общем REGISTRY; значения,
+которые дешевле посчитать при чтении (очередь в БД, диспетчер), отдают
+коллекторы — функции, вызываемые при каждом запросе /metrics.
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus."""
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def replace(self, values: Iterable[Tuple[dict, float]]):
+        """Заменить все значения разом (для коллекторов, читающих чужие счётчики, например TTLCache)."""
+        fresh = {self._key(labels): value for labels, value in values}
+        with self._lock:
+            self._values = fresh
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values: Iterable[Tuple[dict, float]]):
+        """Заменить все значения разом (для коллекторов: исчезнувшие метки пропадают)."""
+        fresh = {self._key(labels): value for labels, value in values}
+        with self._lock:
+            self._values = fresh
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # по метке: [счётчики по бакетам (не накопительные)..., сумма, количество]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Декоратор: наблюдать длительность вызова (обычной функции или корутины)."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - started, **labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """collector обновляет свои Gauge перед выдачей метрик."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                # метрики не должны ронять /metrics: сбой виден по отсутствию значений
+                SCRAPE_ERRORS.inc(collector=getattr(collector, "__name__", "collector"))
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# --- метрики приложения ---
+
+SCRAPE_ERRORS = counter("schedule_metrics_collector_errors_total", "Failed metric collectors", ("collector",))
+
+PYRUS_REQUESTS = counter("pyrus_requests_total", "Pyrus API requests", ("endpoint", "method", "status"))
+PYRUS_LATENCY = histogram("pyrus_request_duration_seconds", "Pyrus API request latency", ("endpoint", "method"))
+PYRUS_RETRIES = counter("pyrus_retries_total", "Failed attempts retried by retry_on_exception", ("function",))
+PYRUS_FAILURES = counter("pyrus_failures_total", "Calls that failed after all retries", ("function",))
+
+SCAN_DURATION = histogram("scanner_job_duration_seconds", "Duration of one scanner_job run",
+                          buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+SCAN_CLAIMED = counter("scanner_claimed_tasks_total", "Tasks claimed by the scanner or dispatcher")
+TASK_DURATION = histogram("task_processing_duration_seconds", "Duration of process_task for one task")
+
+TASKS_DUE = gauge("tasks_due", "Due tasks waiting to be claimed")
+TASKS_LOCKED = gauge("tasks_locked", "Tasks currently locked for processing")
+OLDEST_LOCK_AGE = gauge("tasks_oldest_lock_age_seconds", "Age of the oldest processing lock")
+TASKS_BY_STEP = gauge("tasks_by_step", "Active tasks per reminder step", ("step",))
+
+DISPATCHER_IN_FLIGHT = gauge("dispatcher_in_flight", "Tasks in flight in the dispatcher")
+DISPATCHER_UTILIZATION = gauge("dispatcher_utilization", "Share of the dispatcher window in use")
+
+CACHE_HITS = counter("cache_hits_total", "Cache lookups answered from the cache", ("cache",))
+CACHE_MISSES = counter("cache_misses_total", "Cache lookups that missed", ("cache",))
+CACHE_COALESCED = counter("cache_coalesced_total", "Cache misses that waited for a load already in flight", ("cache",))
+CACHE_SIZE = gauge("cache_entries", "Entries currently held in the cache", ("cache",))
+
+WEBHOOK_REQUESTS = counter("webhook_requests_total", "Webhook requests by outcome", ("status",))
+WEBHOOK_DUPLICATES = counter("webhook_duplicates_total", "Redelivered webhook events answered from the dedup cache")
+WEBHOOK_LATENCY = histogram("webhook_request_duration_seconds", "Webhook handling latency",
+                            buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10))
+
+
+def collect_caches(caches: Dict[str, object]):
+    """Выставить метрики кэшей по их stats(): {"member": member_cache, ...}."""
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    CACHE_HITS.replace(({"cache": name}, s["hits"]) for name, s in stats.items())
+    CACHE_MISSES.replace(({"cache": name}, s["misses"]) for name, s in stats.items())
+    CACHE_COALESCED.replace(({"cache": name}, s.get("coalesced", 0)) for name, s in stats.items())
+    CACHE_SIZE.replace(({"cache": name}, s["size"]) for name, s in stats.items())
+
+
+def pyrus_endpoint(url: str) -> str:
+    """Метка эндпоинта Pyrus по URL: auth, task, comments, member."""
+    path = url.split("?", 1)[0].rstrip("/")
+    if path.endswith("/auth"):
+        return "auth"
+    if path.endswith("/comments"):
+        return "comments"
+    if "/members/" in path:
+        return "member"
+    if "/tasks/" in path:
+        return "task"
+    return "other"
+
+
+def observe_pyrus_request(method: str, url: str, status, seconds: float):
+    endpoint = pyrus_endpoint(url)
+    PYRUS_REQUESTS.inc(endpoint=endpoint, method=method.upper(), status=status)
+    PYRUS_LATENCY.observe(seconds, endpoint=endpoint, method=method.upper())
@@ -1,40 +1,45 @@
+import asyncio
 import logging
 
 from app.cleanup_data import cleanup_task
-from app.lock_utils import unlock_task
-from app.pyrus_api import get_responsible, get_member, bot_is_subscriber, remove_bot_from_subscribers, get_task, \
-    APIError
+from app.lock_utils import release_after_failure
+from app.metrics import TASK_DURATION
+from app.pyrus_api import get_members, comment_task, get_task_snapshot, APIError
 from app.texts import Texts
 
 from conf.config import settings
 from app.db_utils import delete_task, get_task_row, bump_step_and_reschedule
-from app.pyrus_api import send_comment, is_task_closed
+from app.pyrus_api import send_comment
 
 
 logger = logging.getLogger(__name__)
 
-def process_task(task_id: int, token: str):
+@TASK_DURATION.time()
+def process_task(task_id: int, token: str, row=None):
+    """row — строка active_tasks, уже полученная при захвате (claim_due_tasks)."""
     logger.info("Worker picked task %s", task_id)
 
-    row = get_task_row(task_id)
+    if row is None:
+        row = get_task_row(task_id)
     if not row:
         logger.info("Task %s deleted remotely.", task_id)
         return
 
     try:
-        task_exists = get_task(task_id, token, check=True)
+        # одна загрузка задачи на весь проход: проверки ниже работают по снимку
+        snapshot = get_task_snapshot(task_id, token)
 
-        if task_exists is False:
+        if snapshot.exists is False:
             delete_task(task_id)
             logger.info("task %s not found (deleted remotely), removed from DB.", task_id)
             return
 
-        if task_exists is None:
-            unlock_task(task_id)
+        if snapshot.exists is None:
+            release_after_failure(task_id)
             logger.info("task %s check skipped due to network error.", task_id)
             return
 
-        if is_task_closed(task_id, token) or not bot_is_subscriber(task_id, token):
+        if snapshot.is_closed() or not snapshot.bot_is_subscriber():
             cleanup_task(task_id, token, reason="Task closed or bot not subscribed")
             return
 
@@ -42,14 +47,15 @@ def process_task(task_id: int, token: str):
         logger.debug("Task %s current step=%s", task_id, step)
 
         if step in (1, 2, 3):
-            user_info = get_responsible(task_id, token)
+            user_info = snapshot.responsible()
             send_comment(token, task_id, Texts.TEXT_TO_EMPLOYEE, user_info)
             bump_step_and_reschedule(task_id, step + 1)
             return
 
         if step == 4:
-            first_manager_info = get_member(settings.FIRST_MANAGER_ID, token)
-            second_manager_info = get_member(settings.SECOND_MANAGER_ID, token)
+            first_manager_info, second_manager_info = get_members(
+                [settings.FIRST_MANAGER_ID, settings.SECOND_MANAGER_ID], token
+            )
             if not first_manager_info or not second_manager_info:
                 raise APIError("Manager info not found")
 
@@ -57,13 +63,89 @@ def process_task(task_id: int, token: str):
                 "first_manager": first_manager_info,
                 "second_manager": second_manager_info
             }
-            user_info = get_responsible(task_id, token)
-            send_comment(token, task_id, Texts.TEXT_TO_EMPLOYEE_WITH_MANAGER,
-                         {"manager": manager_info, "user": user_info})
-            remove_bot_from_subscribers(task_id, token)
+            user_info = snapshot.responsible()
+            # комментарий, подписка менеджеров и отписка бота — одним запросом
+            comment_task(task_id, token, Texts.TEXT_TO_EMPLOYEE_WITH_MANAGER,
+                         {"manager": manager_info, "user": user_info}, remove_bot=True)
             delete_task(task_id)
             logger.info("Task %s processed with manager and deleted from DB (final step).", task_id)
             return
 
+    except APIError:
+        # ошибки разбора снимка не проходят через retry_on_exception — снимаем блокировку сами
+        release_after_failure(task_id)
+        logger.exception("API error while processing task %s", task_id)
     except Exception:
-        logger.exception("Unhandled error while processing task %s", task_id)
\ No newline at end of file
+        if settings.RETRY_MODE == "reschedule":
+            release_after_failure(task_id)
+        logger.exception("Unhandled error while processing task %s", task_id)
+
+@TASK_DURATION.time()
+async def process_task_async(session, task_id: int, token: str, row=None):
+    """
+    Та же пошаговая обработка, что и process_task, для asyncio-движка сканера.
+    HTTP — через aiohttp-сессию, обращения к SQLite — в asyncio.to_thread.
+    """
+    from app import async_pyrus_api as api
+    from app.cleanup_data import cleanup_task_async
+
+    logger.info("Coroutine picked task %s", task_id)
+
+    if row is None:
+        row = await asyncio.to_thread(get_task_row, task_id)
+    if not row:
+        logger.info("Task %s deleted remotely.", task_id)
+        return
+
+    try:
+        snapshot = await api.get_task_snapshot(session, task_id, token)
+
+        if snapshot.exists is False:
+            await asyncio.to_thread(delete_task, task_id)
+            logger.info("task %s not found (deleted remotely), removed from DB.", task_id)
+            return
+
+        if snapshot.exists is None:
+            await asyncio.to_thread(release_after_failure, task_id)
+            logger.info("task %s check skipped due to network error.", task_id)
+            return
+
+        if snapshot.is_closed() or not snapshot.bot_is_subscriber():
+            await cleanup_task_async(session, task_id, token, reason="Task closed or bot not subscribed")
+            return
+
+        step = row["step"] or 0
+        logger.debug("Task %s current step=%s", task_id, step)
+
+        if step in (1, 2, 3):
+            user_info = snapshot.responsible()
+            await api.send_comment(session, token, task_id, Texts.TEXT_TO_EMPLOYEE, user_info)
+            await asyncio.to_thread(bump_step_and_reschedule, task_id, step + 1)
+            return
+
+        if step == 4:
+            first_manager_info, second_manager_info = await asyncio.gather(
+                api.get_member(session, settings.FIRST_MANAGER_ID, token),
+                api.get_member(session, settings.SECOND_MANAGER_ID, token),
+            )
+            if not first_manager_info or not second_manager_info:
+                raise APIError("Manager info not found")
+
+            manager_info = {
+                "first_manager": first_manager_info,
+                "second_manager": second_manager_info
+            }
+            user_info = snapshot.responsible()
+            await api.comment_task(session, task_id, token, Texts.TEXT_TO_EMPLOYEE_WITH_MANAGER,
+                                   {"manager": manager_info, "user": user_info}, remove_bot=True)
+            await asyncio.to_thread(delete_task, task_id)
+            logger.info("Task %s processed with manager and deleted from DB (final step).", task_id)
+            return
+
+    except APIError:
+        await asyncio.to_thread(release_after_failure, task_id)
+        logger.exception("API error while processing task %s", task_id)
+    except Exception:
+        if settings.RETRY_MODE == "reschedule":
+            await asyncio.to_thread(release_after_failure, task_id)
+        logger.exception("Unhandled error while processing task %s", task_id)
@@ -1,20 +1,46 @@
+import contextlib
+import contextvars
 import functools
+import inspect
 import logging
 import time
-from typing import Type, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Type, List, Optional
 import requests
+from app import http_client, metrics, rate_limit
+from app.cache import TTLCache
 from app.lock_utils import unlock_task
+from app.token_manager import TokenManager
 from conf.config import settings
 from app.utils import build_mention_span, collect_manager_mentions, collect_manager_ids
 
-AUTH_URL = "https://accounts.pyrus.com/api/v4/auth"
+AUTH_URL = settings.PYRUS_AUTH_URL
 
 
 logger = logging.getLogger(__name__)
 
+# сотрудники (менеджеры, ответственные) меняются редко — кэшируем по ID
+member_cache = TTLCache(maxsize=settings.MEMBER_CACHE_SIZE, ttl=settings.MEMBER_CACHE_TTL)
+_lookup_executor = ThreadPoolExecutor(max_workers=settings.MEMBER_LOOKUP_WORKERS,
+                                      thread_name_prefix="member-lookup")
+
 class APIError(RuntimeError):
     """Ошибка при получении токена."""
 
+# внутри single_attempt() retry_on_exception не повторяет вызовы: повторы делает вызывающий
+_single_attempt = contextvars.ContextVar("pyrus_single_attempt", default=False)
+
+
+@contextlib.contextmanager
+def single_attempt():
+    """Вызовы API в этом блоке выполняются по одному разу, без sleep между попытками."""
+    token = _single_attempt.set(True)
+    try:
+        yield
+    finally:
+        _single_attempt.reset(token)
+
+
 def retry_on_exception(tries: int = 2,
                        delay: float = 30.0,
                        exceptions: tuple[Type[BaseException], ...] = (Exception,),
@@ -23,26 +49,35 @@ def retry_on_exception(tries: int = 2,
     Декоратор: выполнить функцию tries раз, если она падает одним из exceptions.
     Между попытками ждать delay секунд.
     Если unlock_on_fail=True, то после всех неудачных попыток вызвать unlock_task(task_id).
+
+    При RETRY_MODE="reschedule" функции с unlock_on_fail=True (вызовы в рамках обработки задачи)
+    выполняются один раз без ожидания: повтор планирует process_task через schedule_retry,
+    и рабочий поток сразу освобождается.
     """
     if tries < 1:
         raise ValueError(f"Было получено {tries} попыток, когда их должно быть >= 1.")
 
     def decorator(func):
+        signature = inspect.signature(func)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            deferred = unlock_on_fail and settings.RETRY_MODE == "reschedule"
+            attempts = 1 if deferred or _single_attempt.get() else tries
             last_exc = None
-            for attempt in range(1, tries + 1):
+            for attempt in range(1, attempts + 1):
                 try:
                     return func(*args, **kwargs)
                 except exceptions as e:
                     last_exc = e
-                    logger.warning(f"Attempt {attempt}/{tries} failed for {func.__name__}: {e!r}")
-                    if attempt < tries:
+                    logger.warning("Attempt %s/%s failed for %s: %r", attempt, attempts, func.__name__, e)
+                    if attempt < attempts:
+                        metrics.PYRUS_RETRIES.inc(function=func.__name__)
                         time.sleep(delay)
 
             # здесь все попытки провалились
-            if unlock_on_fail:
-                task_id = kwargs.get("task_id") or (args[0] if args else None)
+            if unlock_on_fail and not deferred:
+                task_id = signature.bind_partial(*args, **kwargs).arguments.get("task_id")
                 if task_id is not None:
                     try:
                         unlock_task(task_id)
@@ -50,19 +85,20 @@ def retry_on_exception(tries: int = 2,
                     except Exception as ue:
                         logger.error("Failed to unlock task %s after retries: %s", task_id, ue)
             if last_exc:
+                metrics.PYRUS_FAILURES.inc(function=func.__name__)
                 raise last_exc
         return wrapper
     return decorator
 
 
 def build_comments_api_url(task_id):
-    return f"https://api.pyrus.com/v4/tasks/{task_id}/comments"
+    return f"{settings.PYRUS_API_URL}/tasks/{task_id}/comments"
 
 def build_task_api_url(task_id):
-    return f"https://api.pyrus.com/v4/tasks/{task_id}"
+    return f"{settings.PYRUS_API_URL}/tasks/{task_id}"
 
 def build_member_api_url(task_id):
-    return f"https://api.pyrus.com/v4/members/{task_id}"
+    return f"{settings.PYRUS_API_URL}/members/{task_id}"
 
 def parse_json_response(resp: requests.Response, context: str = "") -> dict:
     try:
@@ -73,44 +109,226 @@ def parse_json_response(resp: requests.Response, context: str = "") -> dict:
         raise RuntimeError(msg) from e
 
 
+def member_from_response(member_id: int, data: dict) -> dict:
+    """Разобрать ответ GET /members/{id} в {"id", "fullname"}."""
+    user_id = data.get("id")
+    first_name = data.get("first_name")
+    last_name = data.get("last_name")
+
+    if not user_id:
+        raise APIError(f"The API response in task #{member_id} does not contain the employee's 'id'.: {data}")
+
+    fullname = " ".join(filter(None, [first_name, last_name]))
+    if not fullname:
+        raise APIError(f"The API response in task #{member_id} does not contain the employee's full name: {data}")
+
+    return {
+        "id": user_id,
+        "fullname": fullname
+    }
+
+
+def build_comment_text(task_id: int, text: str, members_info: dict) -> str:
+    """Собрать formatted_text комментария: упоминание исполнителя, менеджеров и текст."""
+    manager_mentions = None
+    managers_info = members_info.get("manager") or {}
+    if managers_info:
+        manager_mentions = collect_manager_mentions(managers_info)
+
+    user_info = members_info.get("user") or {}
+
+    user_id = user_info.get("id") or members_info.get("id")
+    user_fullname = user_info.get("fullname") or members_info.get("fullname")
+
+    if not user_id or not user_fullname:
+        raise APIError(f"Information about the user is missing in the issue #{task_id}")
+
+    user_mention = build_mention_span(user_id, user_fullname)
+
+    mentions_part = ", ".join([user_mention] + manager_mentions) if manager_mentions else user_mention
+
+    return f"{mentions_part}, {text}"
+
+
+def build_comment_body(task_id: int, text: Optional[str] = None, members_info: Optional[dict] = None,
+                       remove_bot: bool = False) -> dict:
+    """
+    Тело составного комментария: текст с упоминаниями, менеджеры в subscribers_added
+    и бот в subscribers_removed — всё, что нужно, одним POST /tasks/{id}/comments.
+    """
+    body = {}
+    if text is not None:
+        members_info = members_info or {}
+        managers_info = members_info.get("manager") or {}
+        if managers_info:
+            managers_ids = collect_manager_ids(managers_info)
+            if not managers_ids:
+                raise APIError(f"managers_ids list is empty for the task #{task_id}")
+            body["subscribers_added"] = managers_ids
+
+        formatted_text = build_comment_text(task_id, text, members_info)
+        if not formatted_text:
+            raise RuntimeError(f"An error occurred when forming the request body for creating a comment in the issue. #{task_id}")
+        body["formatted_text"] = formatted_text
+    if remove_bot:
+        body["subscribers_removed"] = [{"id": settings.BOT_ID}]
+    if not body:
+        raise ValueError(f"Nothing to post in the issue #{task_id}")
+    return body
+
+
+def _send(method: str, url: str, token: str, **kwargs) -> requests.Response:
+    """
+    Запрос к API с токеном. Устаревший токен заменяется актуальным из кэша,
+    при 401 токен обновляется и запрос повторяется один раз.
+    """
+    token = token_manager.current(token)
+    headers = {"Authorization": f"Bearer {token}"}
+    resp = http_client.request(method, url, headers=headers, **kwargs)
+    if resp.status_code == 401:
+        fresh = token_manager.refresh(token)
+        if fresh and fresh != token:
+            logger.info("Got 401 for %s %s, retrying with a refreshed token.", method, url)
+            headers = {"Authorization": f"Bearer {fresh}"}
+            resp = http_client.request(method, url, headers=headers, **kwargs)
+    return resp
+
+
+class TaskSnapshot:
+    """
+    Снимок задачи Pyrus, полученный одним запросом GET /tasks/{id}.
+
+    Один снимок используется за проход обработки для проверок существования,
+    закрытия, подписки бота и получения ответственного.
+
+    exists:
+        True  → задача есть (task — словарь задачи)
+        False → задача удалена/доступ запрещён (403)
+        None  → ошибка сети / неизвестно
+    """
+
+    __slots__ = ("task_id", "task", "exists")
+
+    def __init__(self, task_id: int, task: Optional[dict], exists: Optional[bool]):
+        self.task_id = task_id
+        self.task = task
+        self.exists = exists
+
+    @classmethod
+    def from_response(cls, task_id: int, data: dict) -> "TaskSnapshot":
+        task = data.get("task")
+        error_msg = data.get("error", "")
+
+        if "access_denied_task" in error_msg.lower():
+            return cls(task_id, None, False)
+
+        if not task:
+            return cls(task_id, None, False)
+
+        return cls(task_id, task, True)
+
+    def require_task(self) -> dict:
+        if not isinstance(self.task, dict):
+            logger.warning("Could not retrieve task %s or task is not a dictionary.", self.task_id)
+            raise APIError(f"Could not retrieve task details for task #{self.task_id}")
+        return self.task
+
+    def is_closed(self) -> bool:
+        task = self.require_task()
+        return bool(task.get("close_date") or task.get("is_closed"))
+
+    def bot_is_subscriber(self) -> bool:
+        task = self.require_task()
+        subscribers = task.get("subscribers", [])
+        if not subscribers:
+            logger.warning("Task #%s has no subscribers: %s", self.task_id, task)
+            raise APIError(f"The API response does not contain subscribers for task #{self.task_id}")
+
+        for subscriber in subscribers:
+            person_id = subscriber.get("person", {}).get("id")
+            if person_id == settings.BOT_ID:
+                logger.info("Bot is a subscriber for task %s", self.task_id)
+                return True
+
+        logger.info("Bot is NOT a subscriber for task %s", self.task_id)
+        return False
+
+    def responsible(self) -> dict:
+        task = self.require_task()
+        responsible = task.get("responsible")
+        if not responsible:
+            raise APIError(f"The API response does not contain the person responsible for the task #{self.task_id}: {task}")
+
+        user_id = responsible.get("id")
+        first_name = responsible.get("first_name")
+        last_name = responsible.get("last_name")
+
+        if not user_id:
+            raise APIError(f"The API response in task #{self.task_id} does not contain the employee's 'id'.: {responsible}")
+
+        fullname = " ".join(filter(None, [first_name, last_name]))
+        if not fullname:
+            raise APIError(f"The API response in task #{self.task_id} does not contain the employee's full name: {responsible}")
+
+        info = {
+            "id": user_id,
+            "fullname": fullname
+        }
+        # ответственный — тоже сотрудник: данные из снимка экономят GET /members/{id}
+        member_cache.set(user_id, info)
+        return info
+
+
+def get_task_snapshot(task_id: int, token: str, timeout: int = 30) -> TaskSnapshot:
+    """
+    Получить снимок задачи одним запросом.
+    Сетевые ошибки не бросаются: они дают снимок с exists=None.
+    """
+    url = build_task_api_url(task_id)
+
+    try:
+        resp = _send("GET", url, token, timeout=timeout)
+        resp.raise_for_status()
+    except requests.HTTPError as e:
+        if e.response.status_code == 403:
+            return TaskSnapshot(task_id, None, False)
+        return TaskSnapshot(task_id, None, None)
+    except requests.RequestException as e:
+        logger.warning("Network error while getting task %s: %s", task_id, e)
+        return TaskSnapshot(task_id, None, None)
+
+    data = parse_json_response(resp, context="task")
+    return TaskSnapshot.from_response(task_id, data)
+
+
 def get_task(task_id: int, token: str, timeout: int = 30, check: bool = False):
     """
     Получить задачу по task_id.
 
     :return:
         - словарь задачи
-        - при check=True: True/False/None
-            True  → задача есть
-            False → задача удалена/доступ запрещён (403)
-            None  → ошибка сети / неизвестно
+        - при check=True: True/False/None (см. TaskSnapshot.exists)
     """
+    if check:
+        return get_task_snapshot(task_id, token, timeout).exists
+
     url = build_task_api_url(task_id)
-    headers = {"Authorization": f"Bearer {token}"}
 
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout)
+        resp = _send("GET", url, token, timeout=timeout)
         resp.raise_for_status()
     except requests.HTTPError as e:
         if e.response.status_code == 403:
-            return False if check else None
-        if check:
             return None
         raise APIError(f"Couldn't get task #{task_id}: {e}") from e
     except requests.RequestException as e:
         logger.warning("Network error while getting task %s: %s", task_id, e)
-        if check:
-            return None
         raise APIError(f"Couldn't get task #{task_id}: {e}")
 
     data = parse_json_response(resp, context="task")
     task = data.get("task")
     error_msg = data.get("error", "")
 
-    if check:
-        if "access_denied_task" in error_msg.lower():
-            return False
-        return bool(task)
-
     if task:
         return task
 
@@ -119,86 +337,50 @@ def get_task(task_id: int, token: str, timeout: int = 30, check: bool = False):
 
     raise RuntimeError(f"Failed to parse task #{task_id}: {data}")
 
-@retry_on_exception(tries=3, delay=30,
-                    exceptions=(RuntimeError, requests.RequestException), unlock_on_fail=True)
 def remove_bot_from_subscribers(task_id: int, token: str, timeout: int = 30):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = build_comments_api_url(task_id)
-    bot_id = settings.BOT_ID
-    body = {
-    "subscribers_removed": [
-        {
-            "id": bot_id
-        }
-    ]
-    }
-    try:
-        resp = requests.post(url, headers=headers, timeout=timeout, json=body)
-        resp.raise_for_status()
-    except requests.RequestException as e:
-        raise APIError(f"Couldn't removed bot from subscribers for the issue #{task_id}: {e}") from e
-
-    data = parse_json_response(resp, context="comments")
-
-    if "task" in data and data["task"]:
-        logger.info("bot successfully removed from subscribers.")
-        return True
-
-    raise APIError(f"Couldn't send comment: invalid API response #{task_id}: {data}")
+    result = comment_task(task_id, token, remove_bot=True, timeout=timeout)
+    logger.info("bot successfully removed from subscribers.")
+    return result
 
 @retry_on_exception(tries=3, delay=30,
                     exceptions=(RuntimeError, requests.RequestException), unlock_on_fail=True)
 def bot_is_subscriber(task_id: int, token: str, timeout: int = 30) -> bool:
-    task = get_task(task_id, token, timeout)
-    if not isinstance(task, dict):
-        logger.warning("Could not retrieve task %s or task is not a dictionary.", task_id)
-        raise APIError(f"Could not retrieve task details for task #{task_id}")
-    
-    subscribers = task.get("subscribers", [])
-    if not subscribers:
-        logger.warning("Task #%s has no subscribers: %s", task_id, task)
-        raise APIError(f"The API response does not contain subscribers for task #{task_id}")
-
-    for subscriber in subscribers:
-        person_id = subscriber.get("person", {}).get("id")
-        if person_id == settings.BOT_ID:
-            logger.info("Bot is a subscriber for task %s", task_id)
-            return True
-
-    logger.info("Bot is NOT a subscriber for task %s", task_id)
-    return False
-
-
+    return TaskSnapshot(task_id, get_task(task_id, token, timeout), True).bot_is_subscriber()
 
 
 @retry_on_exception(tries=3, delay=30,
                     exceptions=(RuntimeError, requests.RequestException))
-def get_token(login: str, security_key: str, timeout: int = 30) -> str:
+def fetch_token(login: str, security_key: str, timeout: int = 30) -> dict:
+    """Авторизация в Pyrus без кэша. Возвращает ответ auth (access_token, ...)."""
     payload = {"login": login, "security_key": security_key}
 
     try:
-        resp = requests.post(AUTH_URL, json=payload, timeout=timeout)
+        resp = http_client.request("POST", AUTH_URL, endpoint=rate_limit.AUTH,
+                                   json=payload, timeout=timeout)
         resp.raise_for_status()
     except requests.RequestException as e:
         raise APIError(f"Couldn't get a token: {e}") from e
 
     data = parse_json_response(resp, context="auth")
 
-    token = data.get("access_token")
-
-    if not token:
+    if not data.get("access_token"):
         raise APIError(f"The response does not contain a token: {data}")
-    return token
+    return data
+
+
+token_manager = TokenManager(fetch_token, ttl=settings.TOKEN_TTL_SECONDS,
+                             refresh_margin=settings.TOKEN_REFRESH_MARGIN_SECONDS)
+
+
+def get_token(login: str, security_key: str) -> str:
+    """Получить access-токен из кэша; авторизация выполняется только при истечении срока."""
+    return token_manager.get(login, security_key)
 
 
 @retry_on_exception(tries=3, delay=30.0,
                     exceptions=(APIError, requests.RequestException), unlock_on_fail=True)
 def is_task_closed(task_id: int, token: str, timeout: int = 30) -> bool:
-    task = get_task(task_id, token, timeout)
-    if not isinstance(task, dict):
-        logger.warning(f"Could not retrieve task #{task_id} or task is not a dictionary.")
-        raise APIError(f"Could not retrieve task details for task #{task_id}")
-    return bool(task.get("close_date") or task.get("is_closed"))
+    return TaskSnapshot(task_id, get_task(task_id, token, timeout), True).is_closed()
 
 @retry_on_exception(
     tries=3,
@@ -206,34 +388,50 @@ def is_task_closed(task_id: int, token: str, timeout: int = 30) -> bool:
     exceptions=(APIError, requests.RequestException),
     unlock_on_fail=True
 )
-def get_member(task_id: int, token: str, timeout: int = 30) -> dict:
-    """Получить информацию о сотруднике по ID задачи."""
-    url = build_member_api_url(task_id)
-    headers = {"Authorization": f"Bearer {token}"}
+def fetch_member(member_id: int, token: str, timeout: int = 30) -> dict:
+    """Получить информацию о сотруднике по его ID (запрос к API, без кэша)."""
+    url = build_member_api_url(member_id)
 
     try:
-        resp = requests.get(url, headers=headers, timeout=timeout)
+        resp = _send("GET", url, token, timeout=timeout)
         resp.raise_for_status()
     except requests.RequestException as e:
-        raise APIError(f"Couldn't get an employee #{task_id}: {e}") from e
+        raise APIError(f"Couldn't get an employee #{member_id}: {e}") from e
 
     data = parse_json_response(resp, context="member")
+    return member_from_response(member_id, data)
 
-    user_id = data.get("id")
-    first_name = data.get("first_name")
-    last_name = data.get("last_name")
 
-    if not user_id:
-        raise APIError(f"The API response in task #{task_id} does not contain the employee's 'id'.: {data}")
+def _load_member(member_id: int, token: str, timeout: int) -> dict:
+    # одновременные промахи по одному сотруднику ждут один запрос
+    return member_cache.load(member_id, lambda: fetch_member(member_id, token, timeout))
 
-    fullname = " ".join(filter(None, [first_name, last_name]))
-    if not fullname:
-        raise APIError(f"The API response in task #{task_id} does not contain the employee's full name: {data}")
 
-    return {
-        "id": user_id,
-        "fullname": fullname
-    }
+def get_member(member_id: int, token: str, timeout: int = 30) -> dict:
+    """Получить информацию о сотруднике по его ID из кэша (MEMBER_CACHE_TTL) или из API."""
+    info = member_cache.get(member_id)
+    if info is not None:
+        return info
+    return _load_member(member_id, token, timeout)
+
+
+def get_members(member_ids: List[int], token: str, timeout: int = 30) -> List[dict]:
+    """
+    Получить нескольких сотрудников: из кэша, а промахи — параллельными запросами.
+    Порядок результата совпадает с member_ids.
+    """
+    result = {member_id: member_cache.get(member_id) for member_id in member_ids}
+    missing = [member_id for member_id, info in result.items() if info is None]
+
+    if len(missing) == 1:
+        result[missing[0]] = _load_member(missing[0], token, timeout)
+    elif missing:
+        futures = {member_id: _lookup_executor.submit(_load_member, member_id, token, timeout)
+                   for member_id in missing}
+        for member_id, future in futures.items():
+            result[member_id] = future.result()
+
+    return [result[member_id] for member_id in member_ids]
 
 
 @retry_on_exception(
@@ -262,57 +460,18 @@ def get_due(task_id: int, token: str, timeout: int = 30):
 )
 def get_responsible(task_id: int, token: str, timeout: int = 30) -> dict:
     """Получить информацию об ответственном сотруднике по задаче."""
-    task = get_task(task_id, token, timeout)
-    if not isinstance(task, dict):
-        logger.warning("Could not retrieve task %s or task is not a dictionary.", task_id)
-        raise APIError(f"Could not retrieve task details for task #{task_id}")
-    responsible = task.get("responsible")
-    if not responsible:
-        raise APIError(f"The API response does not contain the person responsible for the task #{task_id}: {task}")
-
-    user_id = responsible.get("id")
-    first_name = responsible.get("first_name")
-    last_name = responsible.get("last_name")
-
-    if not user_id:
-        raise APIError(f"The API response in task #{task_id} does not contain the employee's 'id'.: {responsible}")
-
-    fullname = " ".join(filter(None, [first_name, last_name]))
-    if not fullname:
-        raise APIError(f"The API response in task #{task_id} does not contain the employee's full name: {responsible}")
-
-    return {
-        "id": user_id,
-        "fullname": fullname
-    }
+    return TaskSnapshot(task_id, get_task(task_id, token, timeout), True).responsible()
 
 @retry_on_exception(tries=3, delay=30,
                     exceptions=(RuntimeError, requests.RequestException), unlock_on_fail=True)
 def add_managers_to_subscribers(task_id: int, token: str, ids_approvals: List[dict[str, int]], timeout: int = 30):
-    headers = {"Authorization": f"Bearer {token}"}
-    url = build_comments_api_url(task_id)
-
-    body = {
-        "subscribers_added": ids_approvals
-    }
-    try:
-        resp = requests.post(url, headers=headers, timeout=timeout, json=body)
-        resp.raise_for_status()
-    except requests.RequestException as e:
-        raise APIError(f"Couldn't add managers_to_subscribers for the issue #{task_id}: {e}") from e
-
-    data = parse_json_response(resp, context="comments")
-
-    if "task" in data and data["task"]:
-        logger.info(f"managers successfully added to subscribers in task #{task_id}.")
-        return True
-
-    raise APIError(f"Couldn't add managers: invalid API response #{task_id}: {data}")
+    result = _post_comment(task_id, token, {"subscribers_added": ids_approvals}, timeout)
+    logger.info("managers successfully added to subscribers in task #%s.", task_id)
+    return result
 
 @retry_on_exception(tries=3, delay=30,
-                    exceptions=(RuntimeError, requests.RequestException), unlock_on_fail=True)
+                    exceptions=(RuntimeError, requests.RequestException))
 def update_client(parent_task_id: int, token: str, task_id: int, timeout: int = 30):
-    headers = {"Authorization": f"Bearer {token}"}
     url = build_comments_api_url(task_id)
     
     body = {
@@ -328,74 +487,50 @@ def update_client(parent_task_id: int, token: str, task_id: int, timeout: int =
     }
     
     try:
-        resp = requests.post(url, headers=headers, timeout=timeout, json=body)
+        resp = _send("POST", url, token, timeout=timeout, json=body)
         resp.raise_for_status()
     except requests.RequestException as e:
         raise APIError(f"Couldn't update client for the issue #{task_id}: {e}") from e
     
     data = parse_json_response(resp, context="comments")
     if "task" in data and data["task"]:
-        logger.info(f"client successfully updated in task #{task_id}.")
+        logger.info("client successfully updated in task #%s.", task_id)
         return True
     
     raise APIError(f"Couldn't update client: invalid API response #{task_id}: {data}")
     
-@retry_on_exception(
-    tries=3,
-    delay=30.0,
-    exceptions=(APIError, requests.RequestException),
-    unlock_on_fail=True
-)
-def send_comment(token: str, task_id: int, text: str, members_info: dict, timeout: int = 30) -> bool:
-    """Отправить комментарий в задачу с упоминанием сотрудника."""
-    headers = {"Authorization": f"Bearer {token}"}
+def _post_comment(task_id: int, token: str, body: dict, timeout: int = 30) -> bool:
     url = build_comments_api_url(task_id)
-
-    manager_mentions = None
-
-    managers_info = members_info.get("manager") or {}
-
-    if managers_info:
-
-        managers_ids = collect_manager_ids(managers_info)
-
-        if not managers_ids:
-            raise APIError(f"managers_ids list is empty for the task #{task_id}")
-
-        res = add_managers_to_subscribers(task_id, token, managers_ids)
-
-        if not res:
-            raise APIError(f"Request is not done in the issue #{task_id}")
-
-        manager_mentions = collect_manager_mentions(managers_info)
-
-    user_info = members_info.get("user") or {}
-
-    user_id = user_info.get("id") or members_info.get("id")
-    user_fullname = user_info.get("fullname") or members_info.get("fullname")
-
-    if not user_id or not user_fullname:
-        raise APIError(f"Information about the user is missing in the issue #{task_id}")
-
-    user_mention = build_mention_span(user_id, user_fullname)
-
-    mentions_part = ", ".join([user_mention] + manager_mentions) if manager_mentions else user_mention
-
-    formatted_text = f"{mentions_part}, {text}"
-
-    body = {"formatted_text": formatted_text}
-    if not formatted_text:
-        raise RuntimeError(f"An error occurred when forming the request body for creating a comment in the issue. #{task_id}")
-
     try:
-        resp = requests.post(url, headers=headers, timeout=timeout, json=body)
+        resp = _send("POST", url, token, timeout=timeout, json=body)
         resp.raise_for_status()
     except requests.RequestException as e:
-        raise APIError(f"Couldn't send a comment for the issue #{task_id}: {e}") from e
+        raise APIError(f"Couldn't post a comment for the issue #{task_id}: {e}") from e
 
     data = parse_json_response(resp, context="comments")
 
     if "task" in data and data["task"]:
         return True
 
-    raise APIError(f"Couldn't send comment: invalid API response #{task_id}: {data}")
\ No newline at end of file
+    raise APIError(f"Couldn't post comment: invalid API response #{task_id}: {data}")
+
+
+@retry_on_exception(
+    tries=3,
+    delay=30.0,
+    exceptions=(APIError, requests.RequestException),
+    unlock_on_fail=True
+)
+def comment_task(task_id: int, token: str, text: Optional[str] = None, members_info: Optional[dict] = None,
+                 remove_bot: bool = False, timeout: int = 30) -> bool:
+    """
+    Составной комментарий одним запросом: текст с упоминаниями (если text задан),
+    добавление менеджеров из members_info в подписчики и, при remove_bot, отписка бота.
+    """
+    body = build_comment_body(task_id, text, members_info, remove_bot)
+    return _post_comment(task_id, token, body, timeout)
+
+
+def send_comment(token: str, task_id: int, text: str, members_info: dict, timeout: int = 30) -> bool:
+    """Отправить комментарий в задачу с упоминанием сотрудника (менеджеры подписываются тем же запросом)."""
+    return comment_task(task_id, token, text, members_info, timeout=timeout)
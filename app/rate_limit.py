@@ -0,0 +1,110 @@
+"""
+Общий для процесса ограничитель частоты запросов к Pyrus (token bucket).
+
+Запросы делятся на классы: READ (GET задач и сотрудников), WRITE (комментарии,
+подписчики) и AUTH. У каждого класса своя корзина RATE_LIMIT_*_RPS с запасом
+RATE_LIMIT_BURST. При 429 корзина класса приостанавливается на Retry-After —
+замедляются сразу все потоки и корутины, а не только получивший ответ.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+AUTH = "auth"
+
+
+class TokenBucket:
+    """
+    Потокобезопасная корзина токенов.
+
+    reserve() сразу резервирует токен и возвращает, сколько секунд подождать до
+    его появления, поэтому одна корзина подходит и для потоков (time.sleep),
+    и для asyncio (asyncio.sleep). rate <= 0 — без ограничения.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            # во время паузы токены не копятся, очередь начинает двигаться с её конца
+            start = max(now, self._paused_until)
+            wait = start - now
+            if self.rate > 0:
+                refill_from = max(self._updated, self._paused_until)
+                if now > refill_from:
+                    self._tokens = min(self.burst, self._tokens + (now - refill_from) * self.rate)
+                    self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait += -self._tokens / self.rate
+            return wait
+
+    def acquire(self):
+        """Дождаться разрешения на запрос (блокирует поток)."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов на seconds (после 429), накопленный запас сбрасывается."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+_buckets: Dict[str, TokenBucket] = {
+    READ: TokenBucket(settings.RATE_LIMIT_READ_RPS, settings.RATE_LIMIT_BURST),
+    WRITE: TokenBucket(settings.RATE_LIMIT_WRITE_RPS, settings.RATE_LIMIT_BURST),
+    AUTH: TokenBucket(settings.RATE_LIMIT_AUTH_RPS, 1),
+}
+
+
+def endpoint_class(method: str) -> str:
+    """Класс запроса к API по HTTP-методу (авторизация указывается явно)."""
+    return READ if method.upper() == "GET" else WRITE
+
+
+def get_bucket(endpoint: str) -> TokenBucket:
+    return _buckets[endpoint]
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Retry-After в секундах или HTTP-дате; без заголовка — RATE_LIMIT_DEFAULT_RETRY_AFTER."""
+    if not value:
+        return float(settings.RATE_LIMIT_DEFAULT_RETRY_AFTER)
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return float(settings.RATE_LIMIT_DEFAULT_RETRY_AFTER)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def throttled(endpoint: str, retry_after: Optional[str]) -> float:
+    """Учесть ответ 429: приостановить корзину класса. Возвращает паузу в секундах."""
+    delay = parse_retry_after(retry_after)
+    get_bucket(endpoint).pause(delay)
+    logger.warning("Pyrus API throttled %s requests (429), pausing for %.1f s.", endpoint, delay)
+    return delay
@@ -1,12 +1,14 @@
+import asyncio
 import logging
+import time
 from conf.logging_config import conf_logger
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import timedelta
 
-from app.db_utils import db_connect, fetch_candidates, try_lock_task
-from app.process_task import process_task
+from app.db_utils import claim_due_tasks, recover_stale_locks
+from app.lease import leases
+from app.metrics import SCAN_CLAIMED, SCAN_DURATION
+from app.process_task import process_task, process_task_async
 from app.pyrus_api import get_token
-from app.utils import now_utc, to_iso
 from conf.config import settings
 
 conf_logger()
@@ -15,27 +17,6 @@ logger = logging.getLogger(__name__)
 executor = ThreadPoolExecutor(max_workers=settings.MAX_WORKERS)
 
 
-def recover_stale_locks():
-    """Recovers stale task locks."""
-    expiry = now_utc() - timedelta(minutes=settings.LOCK_EXPIRY_MINUTES)
-    conn = db_connect()
-    try:
-        cur = conn.execute(
-            "SELECT task_id FROM active_tasks WHERE processing = 1 AND locked_at <= ?",
-            (to_iso(expiry),),
-        )
-        stale = [r["task_id"] for r in cur.fetchall()]
-        if stale:
-            logger.info("Recovering stale locks for tasks: %s", stale)
-            conn.executemany(
-                "UPDATE active_tasks SET processing = 0, locked_at = NULL WHERE task_id = ?",
-                [(tid,) for tid in stale],
-            )
-            conn.commit()
-    finally:
-        conn.close()
-
-
 def scanner_job():
     """
     The main scanner job, executed on a schedule.
@@ -48,29 +29,59 @@ def scanner_job():
         logger.exception("Failed to get access token.")
         return
 
+    started = time.perf_counter()
     try:
         recover_stale_locks()
-        candidates = fetch_candidates(settings.LIMIT_PROCESS_TASKS)
-        if not candidates:
+        claimed = claim_due_tasks(settings.LIMIT_PROCESS_TASKS)
+        if not claimed:
             logger.debug("No tasks found for processing.")
             return
+        SCAN_CLAIMED.inc(len(claimed))
+
+        if settings.SCANNER_ENGINE == "asyncio":
+            asyncio.run(_run_async(claimed, auth_token))
+        else:
+            _run_threads(claimed, auth_token)
+    except Exception:
+        logger.exception("Failed to search for tasks.")
+    finally:
+        SCAN_DURATION.observe(time.perf_counter() - started)
+
 
-        futures = {}
-        for task_id in candidates:
-            if try_lock_task(task_id):
-                fut = executor.submit(process_task, task_id, auth_token)
-                futures[fut] = task_id
-            else:
-                logger.info(
-                    "Task #%s is already being processed while trying to lock.", task_id
-                )
+def _run_threads(rows, auth_token):
+    futures = {executor.submit(process_task, row["task_id"], auth_token, row): row["task_id"] for row in rows}
 
-        for fut in as_completed(futures):
-            tid = futures[fut]
+    for fut in as_completed(futures):
+        tid = futures[fut]
+        try:
+            fut.result()
+            logger.info("Task #%s finished successfully.", tid)
+        except Exception:
+            logger.exception("Error during processing of task #%s.", tid)
+        finally:
+            leases.release(tid)
+
+
+async def _run_async(rows, auth_token):
+    """
+    Runs the claimed tasks as coroutines on one event loop.
+    At most ASYNC_CONCURRENCY tasks are in flight at once.
+    """
+    # aiohttp is only required for the asyncio engine
+    from app.async_pyrus_api import create_session
+
+    semaphore = asyncio.Semaphore(settings.ASYNC_CONCURRENCY)
+
+    async def run_one(session, row):
+        tid = row["task_id"]
+        async with semaphore:
             try:
-                fut.result()
+                await process_task_async(session, tid, auth_token, row)
                 logger.info("Task #%s finished successfully.", tid)
             except Exception:
                 logger.exception("Error during processing of task #%s.", tid)
-    except Exception:
-        logger.exception("Failed to search for tasks.")
+            finally:
+                leases.release(tid)
+
+    async with create_session() as session:
+        await asyncio.gather(*(run_one(session, row) for row in rows))
@@ -0,0 +1,130 @@
+"""
+Интерфейс хранилища состояния напоминаний (active_tasks).
+
+Функции app.db_utils (insert_task, claim_due_tasks, bump_step_and_reschedule, ...)
+работают через выбранное хранилище TASK_STORE:
+    "sqlite" — db_utils.SqliteTaskStore, таблица active_tasks в DATABASE_PATH;
+    "memory" — memory_store.MemoryTaskStore, индексы и кучи в памяти процесса
+               (бенчмарки, симуляция, один узел без требований к сохранности).
+
+Все сроки — секунды UTC epoch. fence — (lease_owner, lease_token) текущей аренды
+процесса или None: запись с fence выполняется, только если аренда ещё действует.
+Таймер (due_timer), реестр аренд и логирование остаются в db_utils и общие для обоих.
+"""
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from conf.config import settings
+
+Fence = Optional[Tuple[str, int]]
+# (task_id, due, next_run_at)
+TaskTuple = Tuple[int, int, int]
+# нагрузка слотов окна переноса: (window_start, slot_seconds, slots, exclude_task_id) -> {slot: count}
+SlotLoad = Callable[[int, int, int, int], Dict[int, int]]
+SlotPicker = Callable[[SlotLoad], int]
+
+
+class TaskStore(ABC):
+    """Операции над задачами-напоминаниями; строки — отображения с ключами колонок active_tasks."""
+
+    def init(self):
+        """Подготовить хранилище (схема, миграции)."""
+
+    @abstractmethod
+    def insert(self, task_id: int, due: int, next_run_at: int):
+        """Вставить новую задачу (step=1); дубликат — ошибка."""
+
+    @abstractmethod
+    def register_many(self, rows: Iterable[TaskTuple], on_conflict: str) -> List[Optional[int]]:
+        """
+        Upsert пачки по политике "ignore"/"update_due". Для каждой строки — next_run_at,
+        сохранённый в хранилище, если строка изменилась, иначе None.
+        """
+
+    @abstractmethod
+    def has(self, task_id: int) -> bool: ...
+
+    @abstractmethod
+    def get(self, task_id: int) -> Optional[Mapping]: ...
+
+    @abstractmethod
+    def due_ids(self, now: int, limit: int) -> List[int]:
+        """task_id свободных задач с next_run_at <= now по возрастанию срока."""
+
+    @abstractmethod
+    def count_due(self, now: int) -> int: ...
+
+    @abstractmethod
+    def claim(self, now: int, limit: int, owner: str, lease_expires_at: int) -> List[Mapping]:
+        """Атомарно арендовать до limit готовых задач (processing=1, lease_token+1)."""
+
+    @abstractmethod
+    def try_lock(self, task_id: int, now: int, owner: str, lease_expires_at: int) -> Optional[int]:
+        """Арендовать конкретную свободную задачу; возвращает lease_token или None."""
+
+    @abstractmethod
+    def reschedule(self, task_id: int, step: int, pick_slot: SlotPicker, fence: Fence) -> Optional[int]:
+        """
+        Записать step, next_run_at = pick_slot(slot_load) и освободить задачу.
+        Подсчёт слотов и запись атомарны. Возвращает next_run_at или None, если аренда потеряна.
+        """
+
+    @abstractmethod
+    def retry(self, task_id: int, now: int, backoff: Callable[[int], int],
+              fence: Fence) -> Optional[Tuple[int, int, int]]:
+        """
+        Перенести после сбоя: retry_attempts+1, next_run_at = now + backoff(attempt), освободить.
+        Возвращает (attempt, delay, next_run_at) или None (задачи нет или аренда потеряна).
+        """
+
+    @abstractmethod
+    def set_step(self, task_id: int, step: int, fence: Fence) -> bool: ...
+
+    @abstractmethod
+    def delete(self, task_id: int, fence: Fence) -> bool: ...
+
+    @abstractmethod
+    def unlock(self, task_id: int, fence: Fence) -> bool: ...
+
+    @abstractmethod
+    def renew_leases(self, owner: str, held: Mapping[int, int], lease_expires_at: int) -> List[int]:
+        """Продлить аренды {task_id: token}; возвращает task_id, которые продлить не удалось."""
+
+    @abstractmethod
+    def recover_stale(self, now: int, legacy_expiry: int) -> List[int]:
+        """Освободить задачи с истёкшей арендой (или старой блокировкой без аренды)."""
+
+    @abstractmethod
+    def pending_deadlines(self, until: int) -> Dict[int, int]:
+        """{task_id: next_run_at} свободных задач со сроком не позже until (загрузка due_timer)."""
+
+    @abstractmethod
+    def stats(self, now: int) -> dict:
+        """due, locked, oldest_lock_age, by_step — для метрик."""
+
+
+_store: Optional[TaskStore] = None
+_store_lock = threading.Lock()
+
+
+def get_task_store() -> TaskStore:
+    """Хранилище процесса по TASK_STORE (создаётся при первом обращении)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.TASK_STORE == "memory":
+                    from app.memory_store import MemoryTaskStore
+                    _store = MemoryTaskStore()
+                else:
+                    from app.db_utils import SqliteTaskStore
+                    _store = SqliteTaskStore()
+    return _store
+
+
+def set_task_store(store: Optional[TaskStore]):
+    """Подменить хранилище процесса (например, в бенчмарке); None — вернуть выбор по TASK_STORE."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,88 @@
+"""
+Единый разбор и форматирование времени.
+
+Правила одинаковы для вебхука, БД и расчёта сроков:
+    "...Z" и "+00:00"           — UTC;
+    смещение "+03:00"           — переводится в UTC;
+    время без зоны              — считается UTC;
+    только дата "YYYY-MM-DD"    — полночь UTC.
+Строка сразу передаётся в datetime.fromisoformat (с Python 3.11 он понимает "Z");
+к значениям без зоны (YYYY-MM-DD, YYYY-MM-DDTHH:MM:SS[.ffffff]) зона дописывается
+строкой. Прочие ISO-варианты (наносекунды, "Z" на Python < 3.11) разбирает
+dateutil, результат кэшируется. Ошибка разбора — всегда ValueError.
+"""
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional, Union
+
+from dateutil.parser import isoparse
+
+Timestamp = Union[str, datetime]
+
+
+@lru_cache(maxsize=1024)
+def _parse_fallback(s: str) -> datetime:
+    try:
+        return isoparse(s)
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"invalid timestamp: {s!r}") from e
+
+
+def parse_timestamp(value: Timestamp) -> datetime:
+    """Строка ISO / дата / datetime -> aware datetime в UTC; ValueError при некорректном значении."""
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, str):
+        s = value.strip()
+        if not s:
+            raise ValueError("empty timestamp")
+        # зона дописывается в строку: дешевле, чем replace(tzinfo=...) после разбора
+        raw, n = s, len(s)
+        if (n == 19 or n == 26) and s[-1] not in "Zz":  # YYYY-MM-DDTHH:MM:SS[.ffffff] без зоны
+            s += "+00:00"
+        elif n == 10:  # YYYY-MM-DD
+            s += "T00:00:00+00:00"
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            dt = _parse_fallback(raw)
+    else:
+        raise ValueError(f"unsupported timestamp: {value!r}")
+
+    tz = dt.tzinfo
+    if tz is timezone.utc:
+        return dt
+    if tz is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def parse_optional(value: Optional[Timestamp]) -> Optional[datetime]:
+    """Как parse_timestamp, но пустое значение -> None."""
+    return parse_timestamp(value) if value else None
+
+
+def format_timestamp(dt: datetime) -> str:
+    """aware datetime -> ISO-строка в UTC ("...+00:00")."""
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def normalize(value: Timestamp) -> str:
+    """Привести значение к ISO-строке в UTC."""
+    return format_timestamp(parse_timestamp(value))
+
+
+def shift(value: Timestamp, **delta) -> str:
+    """Сдвинуть момент на timedelta(**delta) и вернуть ISO-строку в UTC."""
+    return format_timestamp(parse_timestamp(value) + timedelta(**delta))
+
+
+def to_epoch(value: Union[Timestamp, int]) -> int:
+    """Строка ISO / datetime / epoch -> целые секунды UTC epoch (формат колонок времени active_tasks)."""
+    if isinstance(value, int):
+        return value
+    return int(parse_timestamp(value).timestamp())
+
+
+def from_epoch(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
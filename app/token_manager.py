@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Credentials = Tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ("token", "previous", "expires_at", "lock")
+
+    def __init__(self):
+        self.token: Optional[str] = None
+        self.previous: Optional[str] = None
+        self.expires_at: float = 0.0
+        self.lock = threading.Lock()
+
+
+class TokenManager:
+    """
+    Кэш access-токенов Pyrus по учётным данным (login, security_key).
+
+    Токен живёт до expires_in из ответа авторизации (или ttl, если его нет)
+    минус refresh_margin. Обновление single-flight: при одновременных запросах
+    авторизацию выполняет один поток, остальные ждут и берут его результат.
+    """
+
+    def __init__(self, fetch: Callable[[str, str], dict], ttl: float, refresh_margin: float = 60.0):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._margin = refresh_margin
+        self._entries: Dict[Credentials, _Entry] = {}
+        self._by_token: Dict[str, Credentials] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, creds: Credentials) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(creds)
+            if entry is None:
+                entry = self._entries[creds] = _Entry()
+            return entry
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        return entry.token is not None and time.monotonic() < entry.expires_at
+
+    def _renew(self, creds: Credentials, entry: _Entry) -> str:
+        """Вызывать под entry.lock."""
+        data = self._fetch(*creds)
+        token = data["access_token"]
+        lifetime = data.get("expires_in") or self._ttl
+        try:
+            lifetime = float(lifetime)
+        except (TypeError, ValueError):
+            lifetime = self._ttl
+
+        with self._lock:
+            # храним только текущий и предыдущий токен, чтобы in-flight задачи могли перейти на новый
+            if entry.previous is not None:
+                self._by_token.pop(entry.previous, None)
+            entry.previous = entry.token
+            entry.token = token
+            entry.expires_at = time.monotonic() + max(lifetime - self._margin, 0.0)
+            self._by_token[token] = creds
+        logger.debug("Access token for %s refreshed, valid for %.0f s.", creds[0], lifetime)
+        return token
+
+    def get(self, login: str, security_key: str) -> str:
+        creds = (login, security_key)
+        entry = self._entry(creds)
+        if self._is_fresh(entry):
+            return entry.token  # type: ignore
+
+        with entry.lock:
+            # пока ждали блокировку, токен мог обновить другой поток
+            if self._is_fresh(entry):
+                return entry.token  # type: ignore
+            return self._renew(creds, entry)
+
+    def current(self, token: str) -> str:
+        """Вернуть актуальный токен вместо устаревшего (если он выдан этим менеджером)."""
+        creds = self._by_token.get(token)
+        if creds is None:
+            return token
+        entry = self._entries.get(creds)
+        if entry is None or entry.token is None:
+            return token
+        return entry.token
+
+    def refresh(self, stale_token: str) -> Optional[str]:
+        """
+        Принудительно обновить токен после 401.
+        Возвращает новый токен или None, если stale_token не выдан этим менеджером.
+        """
+        creds = self._by_token.get(stale_token)
+        if creds is None:
+            return None
+        entry = self._entry(creds)
+        with entry.lock:
+            if entry.token is not None and entry.token != stale_token:
+                # другой поток уже обновил токен
+                return entry.token
+            return self._renew(creds, entry)
+
+    def invalidate(self, login: str, security_key: str):
+        entry = self._entry((login, security_key))
+        with entry.lock:
+            entry.expires_at = 0.0
@@ -1,8 +1,9 @@
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from typing import Dict, Iterable, List, Mapping, Optional, Union, Any
 from conf.config import settings
 from flask import jsonify
+from app.timestamps import format_timestamp, normalize, parse_optional, parse_timestamp, shift
 
 logger = logging.getLogger(__name__)
 
@@ -34,41 +35,24 @@ def check_client(fields: Iterable[Mapping[str, Any]],
                 
             
 def to_iso(dt: datetime) -> str:
-    return dt.astimezone(timezone.utc).isoformat()
+    return format_timestamp(dt)
+
+
+def now_epoch() -> int:
+    return int(datetime.now(timezone.utc).timestamp())
 
 
 def from_iso(s: str) -> datetime:
-    return datetime.fromisoformat(s).astimezone(timezone.utc)
+    return parse_timestamp(s)
 
 
 def parse_iso_or_date(due: Union[str, datetime]) -> Optional[datetime]:
     """Разбирает строку ISO или YYYY-MM-DD в aware datetime (UTC)."""
-    if not due:
-        return None
-
-    if isinstance(due, datetime):
-        dt = due
-    else:
-        s = due.strip()
-        # fromisoformat не принимает 'Z', заменим его
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        try:
-            dt = datetime.fromisoformat(s)
-        except ValueError:
-            # пробуем только дату YYYY-MM-DD
-            dt = datetime.strptime(s, "%Y-%m-%d")
-    # Сделаем aware и переведём в UTC
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    else:
-        dt = dt.astimezone(timezone.utc)
-    return dt
+    return parse_optional(due)
 
 
 def create_iso_date_with_duration(dt: str, duration_minutes) -> str:
-    due_date = datetime.fromisoformat(dt)
-    return (due_date + timedelta(minutes=duration_minutes)).isoformat()
+    return shift(dt, minutes=duration_minutes)
 
 
 def add_interval_to_due(
@@ -82,45 +66,24 @@ def add_interval_to_due(
     Прибавляет интервал к due и возвращает ISO строку в UTC.
     Возвращает None если due пустой/None.
     """
-    dt = parse_iso_or_date(due)
-    if dt is None:
+    if not due:
         return None
-
-    delta = timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
-    new_dt = dt + delta
-    # Возвращаем ISO с +00:00
-    return new_dt.astimezone(timezone.utc).isoformat()
+    return shift(due, days=days, hours=hours, minutes=minutes, seconds=seconds)
 
 
 def normalize_due(due: str) -> Optional[str]:
     """
-    Преобразует due в ISO формат с временем в UTC.
-    
+    Преобразует due в ISO формат с временем в UTC (правила разбора — app.timestamps).
+
     Поддерживает:
-    - только дату "YYYY-MM-DD" -> добавляется 00:00:00
-    - ISO с временем "YYYY-MM-DDTHH:MM:SS" или с часовым поясом
-    
+    - только дату "YYYY-MM-DD" -> 00:00:00 UTC
+    - ISO с временем "YYYY-MM-DDTHH:MM:SS" (без зоны — UTC) или с часовым поясом
+
     Возвращает ISO строку в UTC или None, если due пустой.
     """
     if not due:
         return None
-
-    try:
-        # Обработка ISO формата с Z или с часовым поясом
-        if due.endswith("Z"):
-            dt = datetime.fromisoformat(due.replace("Z", "+00:00"))
-        else:
-            dt = datetime.fromisoformat(due)
-    except ValueError:
-        # Если не ISO, пробуем как YYYY-MM-DD
-        dt = datetime.strptime(due, "%Y-%m-%d")
-        dt = dt.replace(tzinfo=timezone.utc)
-
-    # Переводим в UTC, если есть tzinfo
-    if dt.tzinfo is not None:
-        dt = dt.astimezone(timezone.utc)
-
-    return dt.isoformat()
+    return normalize(due)
 
 
 def last_comment_has_bot(comments: List[Dict]) -> bool:
@@ -133,7 +96,7 @@ def last_comment_has_bot(comments: List[Dict]) -> bool:
 
 
 def log_and_abort(message, task_id=None, code=400):
-    logger.warning(f"task {task_id} {message}.")
+    logger.warning("task %s %s.", task_id, message)
     return jsonify({"error": message}), code
 
 
@@ -187,14 +150,14 @@ def parse_and_compare_due(task_id: str, new_due: str, due: str) -> bool:
     :return: True, если даты есть и отличаются, False иначе
     """
     try:
-        new_due_dt = datetime.fromisoformat(new_due) if new_due else None
-        due_dt = datetime.fromisoformat(due) if due else None
+        new_due_dt = parse_optional(new_due)
+        due_dt = parse_optional(due)
     except ValueError as e:
-        logger.exception(f"Invalid date format for task #{task_id}: {e}")
+        logger.exception("Invalid date format for task #%s: %s", task_id, e)
         return False
 
     if new_due_dt and due_dt and new_due_dt != due_dt:
-        logger.info(f"Due date differs for task #{task_id}.")
+        logger.info("Due date differs for task #%s.", task_id)
         return True
 
     return False
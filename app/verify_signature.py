@@ -1,47 +1,87 @@
+"""
+Проверка входящих вебхуков Pyrus.
+
+Порядок: дешёвые заголовки (User-Agent, X-Pyrus-Retry, наличие подписи) -> HMAC по
+сырым байтам тела -> разбор JSON один раз. Отклонённые запросы не разбираются.
+Состояние HMAC после ключа считается один раз на секрет; на запрос — только copy().
+JSON разбирает orjson, если он установлен, иначе стандартный json.
+"""
+import hashlib
+import hmac
+import json
 import re
-from flask import request
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
 from app.utils import log_and_abort
+from conf.config import settings
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+USER_AGENT_RE = re.compile(r'^Pyrus-Bot-(\d+)$')
+SUPPORTED_API_VERSION = 4
+ALLOWED_RETRIES = frozenset({"1/3", "2/3", "3/3"})
+
+
+@lru_cache(maxsize=4)
+def _keyed_mac(secret: str) -> "hmac.HMAC":
+    # ключ уже обработан (ipad/opad); копия дешевле нового hmac.new
+    return hmac.new(secret.encode(), digestmod=hashlib.sha1)
+
+
+def _is_signature_correct(body: bytes, secret: str, signature: str) -> bool:
+    mac = _keyed_mac(secret).copy()
+    mac.update(body)
+    # сравниваем байты: compare_digest не принимает str с не-ASCII символами (TypeError -> 500)
+    return hmac.compare_digest(mac.hexdigest().encode(), signature.lower().encode())
+
 
 def verify_signature(body: bytes, signature: str) -> bool:
     """
     Проверка HMAC-SHA1: Pyrus присылает X-Pyrus-Sig = HMAC-SHA1(secret + body)
     """
-    mac = hmac.new(settings.SECURITY_KEY.encode(), body, hashlib.sha1)
-    return hmac.compare_digest(mac.hexdigest(), signature)
+    return _is_signature_correct(body, settings.SECURITY_KEY, signature)
+
 
+def loads_json(raw: bytes) -> Any:
+    """Разобрать JSON из байтов (orjson, если доступен); ValueError при некорректном теле."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
-def validate_pyrus_request(request, secret):
+
+def validate_pyrus_request(request, secret) -> Tuple[Optional[bytes], Optional[Any]]:
     """
-    Проверяет User-Agent, X-Pyrus-Sig и X-Pyrus-Retry.
-    В случае успеха возвращает сырые байты тела (request.get_data(cache=True)).
-    В случае ошибки вызывает log_and_abort(msg) и возвращает его результат.
-    Ожидается, что log_and_abort формирует и возвращает корректный Flask-ответ.
+    Проверяет User-Agent, X-Pyrus-Retry и X-Pyrus-Sig.
+    Возвращает (сырые байты тела, None) при успехе или (None, ответ log_and_abort) при ошибке.
+    Тело читается один раз и не кэшируется в request: JSON разбирается из этих же байтов.
     """
-    # raw body — обязательно именно байты, с кэшем, чтобы потом можно было request.get_json()
-    raw = request.get_data(cache=True)
+    headers = request.headers
 
     # 1) User-Agent: Pyrus-Bot-4
-    ua = request.headers.get('User-Agent', '')
-    m = re.match(r'^Pyrus-Bot-(d+)$', ua)
+    m = USER_AGENT_RE.match(headers.get('User-Agent', ''))
     if not m:
-        return log_and_abort("invalid user agent")
-    if int(m.group(1)) != 4:
-        return log_and_abort("unsupported Pyrus API version")
+        return None, log_and_abort("invalid user agent")
+    if int(m.group(1)) != SUPPORTED_API_VERSION:
+        return None, log_and_abort("unsupported Pyrus API version")
+
+    # 2) X-Pyrus-Retry: одно из "1/3", "2/3", "3/3"
+    if headers.get('X-Pyrus-Retry', '') not in ALLOWED_RETRIES:
+        return None, log_and_abort("invalid retry header")
 
-    # 2) X-Pyrus-Sig: подпись (возможный формат "sha1=...") и её проверка
-    sig = request.headers.get('X-Pyrus-Sig', '')
+    # 3) X-Pyrus-Sig: подпись (возможный формат "sha1=...") и её проверка
+    sig = headers.get('X-Pyrus-Sig', '')
     if not sig:
-        return log_and_abort("missing signature")
+        return None, log_and_abort("missing signature")
     # убрать возможный префикс "sha1="
     if sig.startswith('sha1='):
-        sig = sig.split('=', 1)[1]
+        sig = sig[5:]
 
+    raw = request.get_data(cache=False)
     if not _is_signature_correct(raw, secret, sig):
-        return log_and_abort("invalid signature")
-
-    # 3) X-Pyrus-Retry: одно из "1/3", "2/3", "3/3"
-    retry = request.headers.get('X-Pyrus-Retry', '')
-    if retry not in ALLOWED_RETRIES:
-        return log_and_abort("invalid retry header")
+        return None, log_and_abort("invalid signature")
 
-    return True
\ No newline at end of file
+    return raw, None
@@ -0,0 +1,92 @@
+"""
+Отсечение повторных доставок вебхука.
+
+Pyrus повторяет доставку (X-Pyrus-Retry 1/3..3/3) и присылает много событий на
+одну задачу. Событие определяется парой (task_id, last_modified_date): если она
+уже обработана (ответ 200), повтор получает 200 сразу после проверки подписи,
+без нормализации дат и обращений к БД.
+
+Пары хранятся в TTLCache (WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL). При
+WEBHOOK_DEDUP_PERSIST они дублируются в таблицу webhook_events: после рестарта
+промах кэша проверяется по ней, а найденная пара возвращается в кэш.
+"""
+import logging
+import sqlite3
+import time
+from typing import Hashable, Optional, Tuple
+
+from app.cache import TTLCache
+from app.db_connect import db_connect
+from conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+EventKey = Tuple[int, str]
+
+# старые строки webhook_events удаляются раз в PRUNE_EVERY записанных событий
+PRUNE_EVERY = 1000
+
+
+def event_key(data: dict) -> Optional[EventKey]:
+    """(task_id, last_modified_date) события или None, если одного из полей нет."""
+    task = data.get("task") or {}
+    task_id = data.get("task_id") or task.get("id")
+    last_modified = task.get("last_modified_date")
+    if not task_id or not isinstance(last_modified, str):
+        return None
+    try:
+        return int(task_id), last_modified
+    except (TypeError, ValueError):
+        return None
+
+
+class WebhookDedup:
+
+    def __init__(self, maxsize: int, ttl: int, persist: bool = False):
+        self.ttl = ttl
+        self.persist = persist
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._marked = 0
+
+    def seen(self, key: Hashable) -> bool:
+        if self._cache.get(key) is not None:
+            return True
+        if not self.persist:
+            return False
+        try:
+            row = db_connect().execute(
+                "SELECT 1 FROM webhook_events WHERE task_id = ? AND last_modified = ? AND handled_at > ?",
+                (*key, int(time.time()) - self.ttl)
+            ).fetchone()
+        except sqlite3.Error:
+            # без таблицы событие просто обрабатывается заново
+            logger.exception("Failed to look up webhook event %s.", key)
+            return False
+        if row is None:
+            return False
+        self._cache.set(key, True)
+        return True
+
+    def mark(self, key: Hashable):
+        """Событие обработано: следующие доставки ответить 200 без обработки."""
+        self._cache.set(key, True)
+        if not self.persist:
+            return
+        now = int(time.time())
+        try:
+            with db_connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO webhook_events (task_id, last_modified, handled_at) VALUES (?, ?, ?)",
+                    (*key, now)
+                )
+                self._marked += 1
+                if self._marked % PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM webhook_events WHERE handled_at <= ?", (now - self.ttl,))
+        except sqlite3.Error:
+            logger.exception("Failed to persist webhook event %s.", key)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+webhook_dedup = WebhookDedup(settings.WEBHOOK_DEDUP_SIZE, settings.WEBHOOK_DEDUP_TTL, settings.WEBHOOK_DEDUP_PERSIST)
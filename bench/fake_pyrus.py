@@ -0,0 +1,202 @@
+"""
+Локальный стенд Pyrus API для нагрузочных прогонов.
+
+Отвечает на POST /auth, GET /v4/tasks/{id}, GET /v4/members/{id} и
+POST /v4/tasks/{id}/comments. Задержка, доля ошибок 500 и доля ответов 429
+настраиваются. Любая задача считается открытой, а бот — её подписчиком.
+Счётчики запросов по эндпоинтам доступны через FakePyrus.calls.
+
+Запуск отдельно:
+    python -m bench.fake_pyrus --port 8765 --latency-ms 50 --error-rate 0.01 --throttle-rate 0.01
+и в .env приложения:
+    PYRUS_API_URL=http://127.0.0.1:8765/v4
+    PYRUS_AUTH_URL=http://127.0.0.1:8765/auth
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+BOT_ID = 99
+
+_TASK_RE = re.compile(r"^/v4/tasks/(\d+)$")
+_COMMENTS_RE = re.compile(r"^/v4/tasks/(\d+)/comments$")
+_MEMBER_RE = re.compile(r"^/v4/members/(\d+)$")
+
+
+class _Server(ThreadingHTTPServer):
+    # очередь listen(): при 5 по умолчанию сотни одновременных соединений asyncio-движка
+    # получают отказ ещё до accept
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakePyrus:
+    """
+    Стенд в фоновом потоке.
+
+    latency_ms — задержка каждого ответа (± latency_jitter доля),
+    error_rate — доля ответов 500, throttle_rate — доля ответов 429 с Retry-After.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 latency_jitter: float = 0.2, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0, bot_id: int = BOT_ID):
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.bot_id = bot_id
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/v4"
+
+    @property
+    def auth_url(self) -> str:
+        return f"{self.base_url}/auth"
+
+    def start(self) -> "FakePyrus":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-pyrus", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _count(self, endpoint: str):
+        with self._lock:
+            self.calls[endpoint] += 1
+
+    def _delay(self):
+        if self.latency_ms > 0:
+            jitter = random.uniform(-self.latency_jitter, self.latency_jitter)
+            time.sleep(self.latency_ms * (1 + jitter) / 1000)
+
+    def _task(self, task_id: int) -> dict:
+        return {
+            "id": task_id,
+            "responsible": {"id": 1000 + task_id % 50, "first_name": "Ivan", "last_name": f"Petrov{task_id % 50}"},
+            "subscribers": [{"person": {"id": self.bot_id}}],
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # заголовки и тело уходят одним send: иначе Nagle + delayed ACK добавляют ~40 мс
+            wbufsize = 64 * 1024
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, headers: Optional[dict] = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_body(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                return json.loads(raw) if raw else {}
+
+            def _route(self, method: str):
+                body = self._read_body() if method == "POST" else {}
+                path = self.path.split("?", 1)[0]
+
+                if method == "POST" and path == "/auth":
+                    endpoint = "auth"
+                elif method == "GET" and _TASK_RE.match(path):
+                    endpoint = "task"
+                elif method == "GET" and _MEMBER_RE.match(path):
+                    endpoint = "member"
+                elif method == "POST" and _COMMENTS_RE.match(path):
+                    endpoint = "comments"
+                else:
+                    self._reply(404, {"error": "not found"})
+                    return
+                fake._count(endpoint)
+                fake._delay()
+
+                roll = random.random()
+                if roll < fake.throttle_rate:
+                    self._reply(429, {"error": "too many requests"}, {"Retry-After": str(fake.retry_after)})
+                    return
+                if roll < fake.throttle_rate + fake.error_rate:
+                    self._reply(500, {"error": "internal error"})
+                    return
+
+                if endpoint == "auth":
+                    self._reply(200, {"access_token": f"fake-{time.monotonic_ns()}", "expires_in": 3600})
+                elif endpoint == "task":
+                    self._reply(200, {"task": fake._task(int(_TASK_RE.match(path).group(1)))})
+                elif endpoint == "member":
+                    member_id = int(_MEMBER_RE.match(path).group(1))
+                    self._reply(200, {"id": member_id, "first_name": "Manager", "last_name": str(member_id)})
+                else:
+                    task_id = int(_COMMENTS_RE.match(path).group(1))
+                    self._reply(200, {"task": {"id": task_id, "comments": [body]}})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Pyrus API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--bot-id", type=int, default=BOT_ID)
+    args = parser.parse_args()
+
+    fake = FakePyrus(args.host, args.port, args.latency_ms, error_rate=args.error_rate,
+                     throttle_rate=args.throttle_rate, retry_after=args.retry_after, bot_id=args.bot_id)
+    print(f"Fake Pyrus listening on {fake.base_url} (API {fake.api_url}, auth {fake.auth_url})")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(fake.calls))
+
+
+if __name__ == "__main__":
+    main()
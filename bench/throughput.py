@@ -0,0 +1,249 @@
+"""
+Сквозной замер пропускной способности обработки напоминаний на локальном стенде.
+
+Поднимает bench.fake_pyrus и заполняет временную БД N готовыми задачами, затем
+прогоняет их выбранным движком:
+    scanner    — scanner_job() по кругу (SCANNER_ENGINE из окружения: thread/asyncio);
+    dispatcher — app.dispatcher.Dispatcher до обработки всех задач;
+    process    — process_task напрямую в пуле из --workers потоков.
+Выводит tasks/sec, p50/p99 времени прохода, число запросов к API и
+число commit в SQLite на задачу. Проходы (вызовы process_task, включая повторы
+после сбоев) и различные обработанные задачи считаются отдельно. --store memory — хранилище задач в памяти
+(app.memory_store): остаются только commit очереди jobs, если она используется.
+
+Пример:
+    python -m bench.throughput --tasks 1000 --engine scanner --workers 16 --latency-ms 40
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fake_pyrus import FakePyrus  # noqa: E402
+
+# обязательные настройки приложения, которые не важны для замера
+_REQUIRED_ENV = {
+    "LOGIN": "bench@example.com",
+    "SECURITY_KEY": "bench",
+    "FIRST_MANAGER_ID": "11",
+    "SECOND_MANAGER_ID": "12",
+    "LOCK_EXPIRY_MINUTES": "10",
+    "SCAN_INTERVAL": "1",
+    "SUBJECT_FORM_ID": "1",
+    "CLIENT_FIELD_ID": "1",
+    "LOGIN_ADNIN": "bench@example.com",
+    "SECURITY_KEY_ADMIN": "bench",
+}
+
+
+class CommitCounter:
+    """Считает COMMIT во всех соединениях SQLite через trace callback."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, statement: str):
+        if statement.startswith("COMMIT"):
+            with self._lock:
+                self.count += 1
+
+
+class LatencyRecorder:
+    """Время каждого прохода (samples) и множество задач, по которым был хотя бы один проход."""
+
+    def __init__(self):
+        self.samples = []
+        self.task_ids = set()
+        self._lock = threading.Lock()
+
+    def add(self, task_id, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self.task_ids.add(task_id)
+
+    def wrap(self, func, task_arg: int = 0):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(args[task_arg], time.perf_counter() - started)
+        return timed
+
+    def wrap_async(self, func, task_arg: int = 1):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(args[task_arg], time.perf_counter() - started)
+        return timed
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark against a fake Pyrus")
+    parser.add_argument("--tasks", type=int, default=500, help="number of due tasks to seed")
+    parser.add_argument("--step", type=int, default=1, choices=(1, 2, 3, 4), help="step of seeded tasks")
+    parser.add_argument("--engine", choices=("scanner", "dispatcher", "process"), default="scanner")
+    parser.add_argument("--workers", type=int, default=8, help="MAX_WORKERS / dispatcher window")
+    parser.add_argument("--batch", type=int, default=100, help="LIMIT_PROCESS_TASKS for scanner_job")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--store", choices=("sqlite", "memory"), default="sqlite", help="TASK_STORE")
+    parser.add_argument("--no-rate-limit", action="store_true", help="disable the client-side rate limiter")
+    parser.add_argument("--timeout", type=float, default=600.0, help="give up after this many seconds")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep application logs")
+    return parser.parse_args(argv)
+
+
+def configure_env(args, fake: FakePyrus, db_path: str):
+    """Настройки читаются при импорте conf.config, поэтому окружение задаётся до импорта app."""
+    for name, value in _REQUIRED_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ["PYRUS_API_URL"] = fake.api_url
+    os.environ["PYRUS_AUTH_URL"] = fake.auth_url
+    os.environ["BOT_ID"] = str(fake.bot_id)
+    os.environ["MAX_WORKERS"] = str(args.workers)
+    os.environ["LIMIT_PROCESS_TASKS"] = str(args.batch)
+    os.environ["TASK_STORE"] = args.store
+    # повторы через sleep(30) сделали бы замер бессмысленным
+    os.environ.setdefault("RETRY_MODE", "reschedule")
+    if args.no_rate_limit:
+        for name in ("RATE_LIMIT_READ_RPS", "RATE_LIMIT_WRITE_RPS", "RATE_LIMIT_AUTH_RPS"):
+            os.environ[name] = "0"
+
+
+def run(args) -> dict:
+    fake = FakePyrus(latency_ms=args.latency_ms, error_rate=args.error_rate,
+                     throttle_rate=args.throttle_rate, retry_after=args.retry_after).start()
+    tmp = tempfile.TemporaryDirectory(prefix="schedule-bench-")
+    configure_env(args, fake, os.path.join(tmp.name, "bench.db"))
+
+    from app import db_connect as db_module
+    from app import scan_tasks
+    from app.db_utils import claim_due_tasks, count_due_tasks, init_db, queue_stats, register_tasks, set_step
+    from app.utils import now_epoch
+    from conf.config import settings
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    commits = CommitCounter()
+    open_connection = db_module._open_connection
+
+    def traced_connection():
+        conn = open_connection()
+        conn.set_trace_callback(commits)
+        return conn
+
+    db_module._open_connection = traced_connection
+
+    init_db()
+    due = now_epoch() - 1
+    register_tasks([(task_id, due, due) for task_id in range(1, args.tasks + 1)])
+    if args.step != 1:
+        for task_id in range(1, args.tasks + 1):
+            set_step(task_id, args.step)
+
+    latency = LatencyRecorder()
+    fake.reset_calls()
+    commits.count = 0
+    deadline = time.monotonic() + args.timeout
+    started = time.perf_counter()
+
+    if args.engine == "scanner":
+        scan_tasks.process_task = latency.wrap(scan_tasks.process_task)
+        scan_tasks.process_task_async = latency.wrap_async(scan_tasks.process_task_async)
+        while count_due_tasks() and time.monotonic() < deadline:
+            scan_tasks.scanner_job()
+    elif args.engine == "dispatcher":
+        from app import dispatcher as dispatcher_module
+
+        dispatcher_module.process_task = latency.wrap(dispatcher_module.process_task)
+        dispatcher = dispatcher_module.Dispatcher(window=args.workers)
+        dispatcher.start()
+        # completed + failed считает проходы, а не задачи: после повтора задача проходит ещё раз.
+        # Останавливаемся, когда ничего не в работе, не захвачено и не готово — два опроса подряд,
+        # чтобы не попасть между захватом пачки и её передачей в пул
+        idle_polls = 0
+        while time.monotonic() < deadline:
+            queue = queue_stats()
+            idle = dispatcher.stats()["in_flight"] == 0 and not queue["due"] and not queue["locked"]
+            idle_polls = idle_polls + 1 if idle else 0
+            if idle_polls >= 2:
+                break
+            time.sleep(0.05)
+        dispatcher.stop()
+    else:
+        from app.process_task import process_task
+        from app.pyrus_api import get_token
+
+        token = get_token(settings.LOGIN, settings.SECURITY_KEY)
+        timed = latency.wrap(process_task)
+        rows = claim_due_tasks(args.tasks)
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(lambda row: timed(row["task_id"], token, row), rows))
+
+    elapsed = time.perf_counter() - started
+    passes = len(latency.samples)
+    processed = len(latency.task_ids)
+    per_task = max(processed, 1)
+    report = {
+        "engine": args.engine if args.engine != "scanner" else f"scanner/{settings.SCANNER_ENGINE}",
+        "store": settings.TASK_STORE,
+        "tasks": args.tasks,
+        "processed": processed,
+        "passes": passes,
+        "left_due": count_due_tasks(),
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(processed / elapsed, 1) if elapsed else 0.0,
+        "passes_per_s": round(passes / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latency.samples, 50) * 1000, 1),
+        "p99_ms": round(percentile(latency.samples, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latency.samples) * 1000, 1) if latency.samples else 0.0,
+        "api_calls": fake.total_calls(),
+        "api_calls_per_task": round(fake.total_calls() / per_task, 2),
+        "api_calls_by_endpoint": dict(fake.calls),
+        "db_commits": commits.count,
+        "db_commits_per_task": round(commits.count / per_task, 2),
+    }
+    fake.stop()
+    tmp.cleanup()
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    width = max(len(k) for k in report)
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main()
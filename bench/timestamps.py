@@ -0,0 +1,133 @@
+"""
+Микро-замер разбора времени: app.timestamps против прежних парсеров.
+
+Прежние функции (db_utils.parse_iso_to_utc, utils.parse_iso_or_date,
+utils.normalize_due, dateutil.isoparse из вебхука) скопированы сюда как эталон.
+Для каждого входа печатает нс/вызов и проверяет, что результаты совпадают там,
+где прежние функции вообще разбирали значение.
+
+Пример:
+    python -m bench.timestamps --number 200000
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# conf.config требует обязательные настройки при импорте app
+for _name in ("LOGIN", "SECURITY_KEY", "LOGIN_ADNIN", "SECURITY_KEY_ADMIN", "DATABASE_PATH"):
+    os.environ.setdefault(_name, "bench")
+for _name in ("FIRST_MANAGER_ID", "SECOND_MANAGER_ID", "MAX_WORKERS", "LOCK_EXPIRY_MINUTES", "SCAN_INTERVAL",
+              "LIMIT_PROCESS_TASKS", "BOT_ID", "SUBJECT_FORM_ID", "CLIENT_FIELD_ID"):
+    os.environ.setdefault(_name, "1")
+
+from dateutil.parser import isoparse  # noqa: E402
+
+from app import timestamps  # noqa: E402
+
+SAMPLES = {
+    "pyrus_z": "2025-08-28T09:30:01Z",
+    "offset": "2025-08-28T12:30:01+03:00",
+    "utc_offset": "2025-08-28T09:30:01+00:00",
+    "naive": "2025-08-28T09:30:01",
+    "fraction": "2025-08-28T09:30:01.123456Z",
+    "date_only": "2025-08-28",
+}
+
+
+def legacy_parse_iso_to_utc(s):
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    if "+" not in s and "-" not in s[-6:]:
+        s = s + "+00:00"
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def legacy_parse_iso_or_date(due):
+    s = due.strip()
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        dt = datetime.strptime(s, "%Y-%m-%d")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    else:
+        dt = dt.astimezone(timezone.utc)
+    return dt
+
+
+def legacy_normalize_due(due):
+    try:
+        if due.endswith("Z"):
+            dt = datetime.fromisoformat(due.replace("Z", "+00:00"))
+        else:
+            dt = datetime.fromisoformat(due)
+    except ValueError:
+        dt = datetime.strptime(due, "%Y-%m-%d")
+        dt = dt.replace(tzinfo=timezone.utc)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.isoformat()
+
+
+def legacy_isoparse_utc(s):
+    return isoparse(s).astimezone(timezone.utc)
+
+
+CANDIDATES = {
+    "timestamps.parse_timestamp": timestamps.parse_timestamp,
+    "timestamps.normalize": timestamps.normalize,
+    "legacy parse_iso_to_utc": legacy_parse_iso_to_utc,
+    "legacy parse_iso_or_date": legacy_parse_iso_or_date,
+    "legacy normalize_due": legacy_normalize_due,
+    "legacy isoparse": legacy_isoparse_utc,
+}
+
+
+def measure(func, value, number: int):
+    try:
+        result = func(value)
+    except ValueError:
+        return None, "error"
+    seconds = min(timeit.repeat(lambda: func(value), number=number, repeat=3))
+    return seconds / number * 1e9, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timestamp parsing micro-benchmark")
+    parser.add_argument("--number", type=int, default=100000, help="calls per measurement")
+    args = parser.parse_args(argv)
+
+    names = list(CANDIDATES)
+    width = max(len(n) for n in names)
+    print(f"{'input':<12} " + " ".join(f"{n:>{width}}" for n in names))
+    mismatches = []
+    for label, value in SAMPLES.items():
+        reference = timestamps.parse_timestamp(value)
+        cells = []
+        for name, func in CANDIDATES.items():
+            ns, result = measure(func, value, args.number)
+            cells.append(f"{'error':>{width}}" if ns is None else f"{ns:>{width - 3}.0f} ns")
+            if isinstance(result, str) and result != "error":
+                result = timestamps.parse_timestamp(result)
+            if isinstance(result, datetime) and result != reference:
+                mismatches.append(f"{label}: {name} -> {result.isoformat()}, codec -> {reference.isoformat()}")
+        print(f"{label:<12} " + " ".join(cells))
+
+    if mismatches:
+        print("\nDifferent results (legacy behaviour the codec unifies):")
+        for line in mismatches:
+            print("  " + line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -18,6 +19,84 @@ class Settings(BaseSettings):
     CLIENT_FIELD_ID: int
     LOGIN_ADNIN: str
     SECURITY_KEY_ADMIN: str
+    # адреса API Pyrus (для локального стенда bench/fake_pyrus.py — http://127.0.0.1:<port>/v4)
+    PYRUS_API_URL: str = "https://api.pyrus.com/v4"
+    PYRUS_AUTH_URL: str = "https://accounts.pyrus.com/api/v4/auth"
+    # пул HTTP-соединений к Pyrus; по умолчанию размер пула = MAX_WORKERS
+    HTTP_POOL_SIZE: Optional[int] = None
+    HTTP_POOL_HOSTS: int = 4
+    HTTP_POOL_BLOCK: bool = True
+    # лимиты запросов к Pyrus на процесс (запросов в секунду, 0 — без ограничения, по умолчанию):
+    # чтение задач/сотрудников, запись комментариев, авторизация. Пауза по Retry-After на 429
+    # действует и без лимитов
+    RATE_LIMIT_READ_RPS: float = 0.0
+    RATE_LIMIT_WRITE_RPS: float = 0.0
+    RATE_LIMIT_AUTH_RPS: float = 0.0
+    RATE_LIMIT_BURST: int = 10
+    RATE_LIMIT_MAX_RETRIES: int = 3
+    RATE_LIMIT_DEFAULT_RETRY_AFTER: int = 5
+    # кэш access-токенов: срок жизни, если Pyrus не вернул expires_in, и запас до истечения
+    TOKEN_TTL_SECONDS: int = 3600
+    TOKEN_REFRESH_MARGIN_SECONDS: int = 60
+    # движок сканера: "thread" (ThreadPoolExecutor), "asyncio" (aiohttp + семафор)
+    # или "dispatcher" (постоянный диспетчер, добирает задачи по мере освобождения потоков)
+    SCANNER_ENGINE: Literal["thread", "asyncio", "dispatcher"] = "thread"
+    ASYNC_CONCURRENCY: int = 200
+    # окно диспетчера (задач в работе одновременно), по умолчанию MAX_WORKERS; период отчёта, с;
+    # максимальный сон без задач (страховочный опрос БД и восстановление зависших блокировок), с
+    DISPATCHER_WINDOW: Optional[int] = None
+    DISPATCHER_REPORT_INTERVAL: int = 60
+    DISPATCHER_IDLE_POLL: int = 60
+    # повторы при сбоях API: "sleep" — ждать в рабочем потоке, "reschedule" — перенести задачу в БД
+    RETRY_MODE: Literal["sleep", "reschedule"] = "sleep"
+    RETRY_BASE_DELAY: int = 30
+    RETRY_MAX_DELAY: int = 3600
+    RETRY_JITTER: float = 0.2
+    # SQLite: соединение на поток, размер кэша страниц (КБ), mmap (байт), кэш подготовленных запросов
+    DB_CACHE_SIZE_KB: int = 20000
+    DB_MMAP_SIZE: int = 268435456
+    DB_CACHED_STATEMENTS: int = 256
+    # пакетная запись задач из вебхука: сброс раз в INGEST_FLUSH_MS или по INGEST_BATCH_SIZE строк
+    INGEST_BATCHING: bool = True
+    INGEST_FLUSH_MS: int = 5
+    INGEST_BATCH_SIZE: int = 200
+    INGEST_ACK_TIMEOUT: int = 10
+    # повторная регистрация той же задачи: "ignore" или "update_due" (обновить due, если изменился)
+    REGISTER_CONFLICT_POLICY: Literal["ignore", "update_due"] = "ignore"
+    # уже обработанные события вебхука (task_id, last_modified_date): повтор сразу получает 200.
+    # Размер и срок жизни кэша в памяти, с; WEBHOOK_DEDUP_PERSIST — дублировать в таблицу
+    # webhook_events, чтобы повторы после рестарта тоже отсекались
+    WEBHOOK_DEDUP_SIZE: int = 10000
+    WEBHOOK_DEDUP_TTL: int = 86400
+    WEBHOOK_DEDUP_PERSIST: bool = False
+    # фоновая очередь заданий (обновление клиента в задачах формы SUBJECT_FORM_ID);
+    # JOB_LOCK_SECONDS — через сколько задание в running считается зависшим и возвращается в очередь
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 10
+    JOB_POLL_INTERVAL: int = 5
+    JOB_LOCK_SECONDS: int = 300
+    # кэш сотрудников (get_member и ответственные из снимков задач)
+    MEMBER_CACHE_SIZE: int = 1024
+    MEMBER_CACHE_TTL: int = 3600
+    MEMBER_LOOKUP_WORKERS: int = 4
+    # окно следующих напоминаний: RESCHEDULE_TIME (по Москве) + RESCHEDULE_WINDOW_MINUTES,
+    # слоты по RESCHEDULE_SLOT_SECONDS; RESCHEDULE_SLOT_CAPACITY > 0 — не больше задач на слот
+    RESCHEDULE_TIME: str = "11:30"
+    RESCHEDULE_WINDOW_MINUTES: int = 60
+    RESCHEDULE_SLOT_SECONDS: int = 60
+    RESCHEDULE_SLOT_CAPACITY: int = 0
+    # аренда задач для нескольких процессов на одной БД: ID процесса (по умолчанию host:pid:random;
+    # стабильный ID позволяет при рестарте сразу вернуть в очередь свои зависшие jobs),
+    # срок аренды и период её продления, с
+    INSTANCE_ID: Optional[str] = None
+    LEASE_SECONDS: int = 120
+    LEASE_HEARTBEAT_SECONDS: int = 30
+    # хранилище напоминаний (app.task_store): "sqlite" — таблица active_tasks,
+    # "memory" — индексы в памяти процесса (бенчмарки, один узел; переживает только до рестарта)
+    TASK_STORE: Literal["sqlite", "memory"] = "sqlite"
+    # логирование: уровень корневого логгера (INFO отключает сборку DEBUG-записей) и JSON-формат
+    LOG_LEVEL: str = "DEBUG"
+    LOG_JSON: bool = False
     
     class Config:
         env_file = str(Path(__file__).resolve().parent.parent / ".env")
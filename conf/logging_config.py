@@ -1,43 +1,129 @@
+import atexit
+import json
 import logging
 import os
+import queue
 import re
 import sys
-from logging.handlers import RotatingFileHandler
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
+_listener: Optional[QueueListener] = None
 
-class StripAnsiFilter(logging.Filter):
+
+class StripAnsiFormatter(logging.Formatter):
+    """Убирает ANSI-последовательности из готовой строки (только для файла)."""
     ANSI_ESCAPE = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
-    def filter(self, record):
-        record.msg = self.ANSI_ESCAPE.sub('', str(record.msg))
-        return True
 
-def conf_logger(log_path=None):
+    def __init__(self, inner: logging.Formatter):
+        super().__init__()
+        self.inner = inner
+
+    def format(self, record):
+        text = self.inner.format(record)
+        return self.ANSI_ESCAPE.sub('', text) if '\x1b' in text else text
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, поток, сообщение, traceback."""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _PreparingQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь, подставив аргументы в сообщение и отформатировав traceback.
+    Остальное форматирование (и запись в файл) выполняет фоновый поток QueueListener.
+    """
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        msg = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = self._exc_formatter.formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+def conf_logger(log_path=None, json_format: Optional[bool] = None, level=None):
+    """
+    Логи пишет фоновый поток QueueListener: рабочие потоки только кладут запись в очередь.
+    Файл — DEBUG (без ANSI), консоль — INFO; json_format (по умолчанию LOG_JSON) — JSON-строки,
+    level (по умолчанию LOG_LEVEL) — уровень корневого логгера.
+    Повторный вызов перенастраивает логирование.
+    """
+    global _listener
+    from conf.config import settings
+
     # по умолчанию лог рядом с этим скриптом
     if log_path is None:
         log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../app.log')
+    if json_format is None:
+        json_format = settings.LOG_JSON
+    if level is None:
+        level = settings.LOG_LEVEL.upper()
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if json_format:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
     # создаём хэндлер для файла
     file_handler = RotatingFileHandler(log_path, maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    file_handler.addFilter(StripAnsiFilter())
+    file_handler.setFormatter(StripAnsiFormatter(formatter))
 
     # консольный хэндлер
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
 
+    previous = _listener
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
     # корневой логгер
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
+    root_logger.setLevel(level)
 
     # очищаем старые хэндлеры и добавляем новые
     root_logger.handlers = []
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    root_logger.addHandler(_PreparingQueueHandler(log_queue))
     logging.getLogger('apscheduler').setLevel(logging.WARNING)
-    
+
+    # старый поток дописывает уже поставленные в очередь записи и закрывает свои файлы
+    if previous is not None:
+        previous.stop()
+        for handler in previous.handlers:
+            handler.close()
+
     # принудительно создаём файл и записываем первый лог
-    root_logger.debug("Logger initialized, log file created")
\ No newline at end of file
+    root_logger.debug("Logger initialized, log file created")
+
+
+def stop_logger():
+    """Дописать очередь и остановить фоновый поток логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logger)